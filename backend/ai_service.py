@@ -18,22 +18,214 @@ Example:
         "logic": "AND"
     }
 """
+import asyncio
+import copy
+import functools
+import hashlib
 import json
 import os
-from typing import Dict, Any, Optional
-import google.generativeai as genai
-from fastapi import HTTPException, status
+import re
+from contextlib import aclosing
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
+import hnswlib
+import fastjsonschema
+import httpx
+import numpy as np
+import orjson
+from cachetools import LRUCache
+from google import genai
+from google.genai import errors, types
+from fastapi import HTTPException, Request, status
+
+
+# Gemini model used for rule generation
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# Maximum number of descriptions kept in the exact-match and semantic rule caches
+RULE_CACHE_SIZE = 1024
+
+# Maximum number of Gemini calls a batch conversion keeps in flight
+BATCH_CONCURRENCY = 8
+
+# Embedding model used for the semantic rule cache
+EMBEDDING_MODEL = "text-embedding-004"
+EMBEDDING_DIM = 768
+
+# Amounts and counts in a description. Embeddings barely separate "$50" from
+# "$500", so a semantic cache hit also requires these tokens to match exactly.
+_NUMBER_RE = re.compile(
+    r"\d+(?:[.,]\d+)*|\b(?:zero|one|two|three|four|five|six|seven|eight|nine|ten"
+    r"|eleven|twelve|fifteen|twenty|thirty|forty|fifty|hundred|thousand|million)\b"
+)
+
+
+def _numeric_tokens(description: str) -> Tuple[str, ...]:
+    """Numbers in a description, in order, as written."""
+    return tuple(_NUMBER_RE.findall(description.lower()))
+
+
+# Static Gemini prompt. The description is appended between prefix and suffix,
+# so each call only concatenates three strings.
+_PROMPT_PREFIX = """You are an expert at converting natural language business rules into structured JSON format for a referral reward system.
+
+The JSON must follow this exact structure:
+{
+  "conditions": [
+    {"field": "path.to.field", "operator": "==|!=|>|<|>=|<=|in|contains", "value": any}
+  ],
+  "actions": [
+    {"type": "credit|debit", "user": "user_field_name", "amount_cents": integer, "reward_id": "string"}
+  ],
+  "logic": "AND|OR"
+}
+
+Rules for conversion:
+1. **Conditions**: Extract all conditions from the description
+   - Common fields: referrer.is_paid_user, referred.subscription_status, referral_count, purchase.amount_cents, user.tier
+   - Operators: == (equals), != (not equals), > < >= <= (comparisons), in (list membership), contains (string contains)
+   - Values: true/false for booleans, numbers for amounts/counts, strings for status/tier
+
+2. **Actions**: Extract reward actions
+   - Type: "credit" for giving rewards, "debit" for taking
+   - User: "referrer_id" for the referrer, "referred_id" for referred user, "user_id" for general
+   - Amount in cents: $1 = 100 cents, $50 = 5000 cents, $100 = 10000 cents
+   - Reward ID: descriptive string like "referral_bonus", "purchase_bonus"
+
+3. **Logic**: "AND" if all conditions must match, "OR" if any condition can match
+
+Examples:
+
+Input: "Reward $50 when a paid user refers someone who subscribes"
+Output:
+{
+  "conditions": [
+    {"field": "referrer.is_paid_user", "operator": "==", "value": true},
+    {"field": "referred.subscription_status", "operator": "==", "value": "active"}
+  ],
+  "actions": [
+    {"type": "credit", "user": "referrer_id", "amount_cents": 5000, "reward_id": "referral_bonus"}
+  ],
+  "logic": "AND"
+}
+
+Input: "Give ₹200 bonus when referred user makes first purchase over ₹1000"
+Output:
+{
+  "conditions": [
+    {"field": "purchase.is_first", "operator": "==", "value": true},
+    {"field": "purchase.amount_cents", "operator": ">", "value": 100000}
+  ],
+  "actions": [
+    {"type": "credit", "user": "referrer_id", "amount_cents": 20000, "reward_id": "first_purchase_bonus"}
+  ],
+  "logic": "AND"
+}
+
+Now convert this rule and return ONLY the JSON, no explanations:
+
+Input: \""""
+
+_PROMPT_SUFFIX = '"\nOutput:\n'
+
+# Structure every generated rule must satisfy, compiled once at import
+RULE_JSON_SCHEMA = {
+    "type": "object",
+    "required": ["conditions", "actions", "logic"],
+    "properties": {
+        "logic": {"enum": ["AND", "OR"]},
+        "conditions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["field", "operator", "value"]
+            }
+        },
+        "actions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["type", "user", "amount_cents"]
+            }
+        }
+    }
+}
+
+_validate_rule_schema = fastjsonschema.compile(RULE_JSON_SCHEMA)
+
+# Markdown code fence Gemini sometimes wraps around the JSON. Anchored to the
+# start/end of the whole response, so backticks inside the JSON are left alone.
+_FENCE_RE = re.compile(r"\A```(?:json)?\n?|\n?```\Z")
+
+
+class _JsonObjectScanner:
+    """
+    Incremental brace-depth scanner for the first balanced {...} object.
+    
+    Text is fed in chunks (e.g. as a response streams in); braces inside
+    JSON strings are ignored. State carries over between chunks, so every
+    character is looked at exactly once.
+    """
+    
+    def __init__(self):
+        self._parts: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+    
+    def feed(self, text: str) -> Optional[str]:
+        """Consume a chunk; return the complete object once it closes, else None."""
+        start = 0 if self._depth else -1
+        
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                if self._depth:
+                    self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    start = i
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(text[start:i + 1])
+                    return "".join(self._parts)
+        
+        if self._depth:
+            self._parts.append(text[start:])
+        return None
+
+
+def _find_json_object(text: str) -> Optional[str]:
+    """Return the first balanced {...} object in text, or None."""
+    return _JsonObjectScanner().feed(text)
 
 
 class AIService:
     """Service for AI-powered rule generation using Gemini."""
     
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        similarity_threshold: float = 0.95,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
         """
         Initialize AI service with Gemini API key.
         
         Args:
             api_key: Gemini API key (defaults to GEMINI_API_KEY env var)
+            similarity_threshold: Minimum cosine similarity for reusing a
+                cached rule generated from a differently worded description
+            http_client: Shared async HTTP client for Gemini calls, so pooled
+                connections and TLS sessions are reused across requests
+                (defaults to a client owned by the SDK)
         """
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
         
@@ -43,11 +235,32 @@ class AIService:
                 "or pass api_key to constructor."
             )
         
-        # Configure Gemini
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-pro')
+        # Configure Gemini client (async calls go through client.aio)
+        http_options = (
+            types.HttpOptions(httpx_async_client=http_client)
+            if http_client is not None
+            else None
+        )
+        self.client = genai.Client(api_key=self.api_key, http_options=http_options)
+        
+        # Exact-match cache: normalized description hash -> validated rule JSON
+        self._cache: LRUCache = LRUCache(maxsize=RULE_CACHE_SIZE)
+        
+        # Semantic cache: nearest-neighbour index over description embeddings.
+        # Labels are slots in a ring buffer; the oldest slot is replaced when full.
+        self.similarity_threshold = similarity_threshold
+        self._semantic_index = hnswlib.Index(space="cosine", dim=EMBEDDING_DIM)
+        self._semantic_index.init_index(
+            max_elements=RULE_CACHE_SIZE,
+            ef_construction=200,
+            M=16,
+            allow_replace_deleted=True
+        )
+        self._semantic_rules: List[Optional[Dict[str, Any]]] = [None] * RULE_CACHE_SIZE
+        self._semantic_numbers: List[Tuple[str, ...]] = [()] * RULE_CACHE_SIZE
+        self._semantic_next = 0
     
-    def natural_language_to_rule(
+    async def natural_language_to_rule(
         self, 
         description: str,
         rule_name: Optional[str] = None
@@ -67,24 +280,39 @@ class AIService:
         
         Example:
             >>> service = AIService()
-            >>> rule = service.natural_language_to_rule(
+            >>> rule = await service.natural_language_to_rule(
             ...     "Reward $50 when paid users refer active subscribers"
             ... )
             >>> print(rule['rule_json']['actions'][0]['amount_cents'])
             5000
         """
-        # Construct prompt for Gemini
-        prompt = self._build_prompt(description)
+        cache_key = self._cache_key(description)
         
         try:
-            # Call Gemini API
-            response = self.model.generate_content(prompt)
-            
-            # Extract JSON from response
-            rule_json = self._extract_json_from_response(response.text)
+            cached_rule_json, embedding = await self._lookup_cached_rule(
+                cache_key, description
+            )
             
-            # Validate the structure
-            self._validate_rule_json(rule_json)
+            if cached_rule_json is not None:
+                # Same description converted before - skip the Gemini round trip
+                rule_json = copy.deepcopy(cached_rule_json)
+            else:
+                # Construct prompt for Gemini
+                prompt = self._build_prompt(description)
+                
+                # Call Gemini API without blocking the event loop
+                response = await self.client.aio.models.generate_content(
+                    model=GEMINI_MODEL,
+                    contents=prompt
+                )
+                
+                # Extract JSON from response
+                rule_json = self._extract_json_from_response(response.text)
+                
+                # Validate the structure
+                self._validate_rule_json(rule_json)
+                
+                self._store_rule(cache_key, description, embedding, rule_json)
             
             # Build complete rule
             result = {
@@ -101,132 +329,248 @@ class AIService:
                 detail=f"AI service error: {str(e)}"
             )
     
+    async def natural_language_to_rule_stream(
+        self,
+        description: str,
+        rule_name: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Convert natural language to rule JSON, streaming Gemini's output.
+        
+        Yields progress events while the rule is generated, so callers can
+        show the JSON as it forms. Generation stops reading the stream as
+        soon as the JSON object closes.
+        
+        Yields:
+            {"status": "generating", "delta": <raw text of this chunk>} per
+            chunk (concatenate the deltas for the text so far), then
+            {"status": "complete", "rule": <same dict as
+            natural_language_to_rule>}
+        
+        Raises:
+            HTTPException: If API call fails or response is invalid
+        """
+        cache_key = self._cache_key(description)
+        
+        try:
+            cached_rule_json, embedding = await self._lookup_cached_rule(
+                cache_key, description
+            )
+            
+            if cached_rule_json is not None:
+                rule_json = copy.deepcopy(cached_rule_json)
+            else:
+                scanner = _JsonObjectScanner()
+                received: List[str] = []
+                candidate = None
+                
+                stream = await self.client.aio.models.generate_content_stream(
+                    model=GEMINI_MODEL,
+                    contents=self._build_prompt(description)
+                )
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        text = chunk.text or ""
+                        received.append(text)
+                        yield {"status": "generating", "delta": text}
+                        
+                        candidate = scanner.feed(text)
+                        if candidate is not None:
+                            break
+                
+                if candidate is not None:
+                    rule_json = orjson.loads(candidate)
+                else:
+                    # Stream ended without a balanced object - fall back to
+                    # the lenient parser (fences, surrounding prose)
+                    rule_json = self._extract_json_from_response("".join(received))
+                
+                self._validate_rule_json(rule_json)
+                self._store_rule(cache_key, description, embedding, rule_json)
+            
+            yield {
+                "status": "complete",
+                "rule": {
+                    "name": rule_name or self._generate_rule_name(description),
+                    "description": description,
+                    "rule_json": rule_json
+                }
+            }
+            
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"AI service error: {str(e)}"
+            )
+    
+    async def natural_language_to_rules_batch(
+        self,
+        descriptions: List[str]
+    ) -> List[Union[Dict[str, Any], Exception]]:
+        """
+        Convert several descriptions concurrently.
+        
+        Calls overlap (bounded by BATCH_CONCURRENCY), so total latency is
+        close to the slowest single conversion rather than the sum.
+        
+        Returns:
+            One entry per description, in order: the rule dict, or the
+            exception raised while converting that description
+        """
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        
+        async def convert(description: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.natural_language_to_rule(description)
+        
+        return await asyncio.gather(
+            *(convert(description) for description in descriptions),
+            return_exceptions=True
+        )
+    
+    def natural_language_to_rule_sync(
+        self,
+        description: str,
+        rule_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Blocking wrapper around natural_language_to_rule for scripts."""
+        return asyncio.run(self.natural_language_to_rule(description, rule_name))
+    
+    @staticmethod
+    def _cache_key(description: str) -> bytes:
+        """Hash of the normalized description used as the rule cache key."""
+        normalized = " ".join(description.lower().split())
+        return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+    
+    async def _lookup_cached_rule(
+        self,
+        cache_key: bytes,
+        description: str
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """
+        Find a previously generated rule for this description.
+        
+        Returns:
+            (cached rule JSON or None, description embedding or None). The
+            embedding is only computed on an exact-cache miss and is needed
+            to store a freshly generated rule in the semantic cache. It is
+            None if the embedding call failed; the semantic cache is then
+            skipped rather than failing the conversion.
+        """
+        cached_rule_json = self._cache.get(cache_key)
+        if cached_rule_json is not None:
+            return cached_rule_json, None
+        
+        # Differently worded but equivalent description converted before?
+        try:
+            embedding = await self._embed(description)
+        except (errors.APIError, httpx.HTTPError):
+            return None, None
+        cached_rule_json = self._semantic_lookup(
+            embedding, _numeric_tokens(description)
+        )
+        
+        if cached_rule_json is not None:
+            self._cache[cache_key] = cached_rule_json
+        
+        return cached_rule_json, embedding
+    
+    def _store_rule(
+        self,
+        cache_key: bytes,
+        description: str,
+        embedding: Optional[np.ndarray],
+        rule_json: Dict[str, Any]
+    ) -> None:
+        """Cache a private copy of a generated rule so callers can't mutate it."""
+        cached_rule_json = copy.deepcopy(rule_json)
+        self._cache[cache_key] = cached_rule_json
+        if embedding is not None:
+            self._semantic_store(
+                embedding, _numeric_tokens(description), cached_rule_json
+            )
+    
+    async def _embed(self, description: str) -> np.ndarray:
+        """Embed a description for the semantic rule cache."""
+        response = await self.client.aio.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=description
+        )
+        return np.asarray(response.embeddings[0].values, dtype=np.float32)
+    
+    def _semantic_lookup(
+        self,
+        embedding: np.ndarray,
+        numbers: Tuple[str, ...]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached rule for the nearest description if similar enough.
+        
+        The cached rule is reused wholesale, amounts included, so the nearest
+        description must also mention exactly the same numbers.
+        """
+        if self._semantic_index.get_current_count() == 0:
+            return None
+        
+        labels, distances = self._semantic_index.knn_query(embedding, k=1)
+        label = labels[0][0]
+        
+        # Cosine space reports distance = 1 - similarity
+        if (
+            1.0 - distances[0][0] >= self.similarity_threshold
+            and self._semantic_numbers[label] == numbers
+        ):
+            return self._semantic_rules[label]
+        return None
+    
+    def _semantic_store(
+        self,
+        embedding: np.ndarray,
+        numbers: Tuple[str, ...],
+        rule_json: Dict[str, Any]
+    ) -> None:
+        """Add a description embedding, its numbers and its rule to the semantic cache."""
+        label = self._semantic_next % RULE_CACHE_SIZE
+        
+        if self._semantic_rules[label] is not None:
+            # Ring buffer is full - evict the oldest entry in this slot
+            self._semantic_index.mark_deleted(label)
+        
+        self._semantic_index.add_items(embedding, [label], replace_deleted=True)
+        self._semantic_rules[label] = rule_json
+        self._semantic_numbers[label] = numbers
+        self._semantic_next += 1
+    
     def _build_prompt(self, description: str) -> str:
         """Build prompt for Gemini API."""
-        return f"""You are an expert at converting natural language business rules into structured JSON format for a referral reward system.
-
-Convert this rule description into JSON format:
-"{description}"
-
-The JSON must follow this exact structure:
-{{
-  "conditions": [
-    {{"field": "path.to.field", "operator": "==|!=|>|<|>=|<=|in|contains", "value": any}}
-  ],
-  "actions": [
-    {{"type": "credit|debit", "user": "user_field_name", "amount_cents": integer, "reward_id": "string"}}
-  ],
-  "logic": "AND|OR"
-}}
-
-Rules for conversion:
-1. **Conditions**: Extract all conditions from the description
-   - Common fields: referrer.is_paid_user, referred.subscription_status, referral_count, purchase.amount_cents, user.tier
-   - Operators: == (equals), != (not equals), > < >= <= (comparisons), in (list membership), contains (string contains)
-   - Values: true/false for booleans, numbers for amounts/counts, strings for status/tier
-
-2. **Actions**: Extract reward actions
-   - Type: "credit" for giving rewards, "debit" for taking
-   - User: "referrer_id" for the referrer, "referred_id" for referred user, "user_id" for general
-   - Amount in cents: $1 = 100 cents, $50 = 5000 cents, $100 = 10000 cents
-   - Reward ID: descriptive string like "referral_bonus", "purchase_bonus"
-
-3. **Logic**: "AND" if all conditions must match, "OR" if any condition can match
-
-Examples:
-
-Input: "Reward $50 when a paid user refers someone who subscribes"
-Output:
-{{
-  "conditions": [
-    {{"field": "referrer.is_paid_user", "operator": "==", "value": true}},
-    {{"field": "referred.subscription_status", "operator": "==", "value": "active"}}
-  ],
-  "actions": [
-    {{"type": "credit", "user": "referrer_id", "amount_cents": 5000, "reward_id": "referral_bonus"}}
-  ],
-  "logic": "AND"
-}}
-
-Input: "Give ₹200 bonus when referred user makes first purchase over ₹1000"
-Output:
-{{
-  "conditions": [
-    {{"field": "purchase.is_first", "operator": "==", "value": true}},
-    {{"field": "purchase.amount_cents", "operator": ">", "value": 100000}}
-  ],
-  "actions": [
-    {{"type": "credit", "user": "referrer_id", "amount_cents": 20000, "reward_id": "first_purchase_bonus"}}
-  ],
-  "logic": "AND"
-}}
-
-Now convert the rule and return ONLY the JSON, no explanations:"""
+        return _PROMPT_PREFIX + description + _PROMPT_SUFFIX
     
     def _extract_json_from_response(self, response_text: str) -> Dict[str, Any]:
         """Extract and parse JSON from Gemini response."""
-        # Remove markdown code blocks if present
-        text = response_text.strip()
-        
-        # Remove ```json and ``` markers
-        if text.startswith("```json"):
-            text = text[7:]
-        elif text.startswith("```"):
-            text = text[3:]
-        
-        if text.endswith("```"):
-            text = text[:-3]
-        
-        text = text.strip()
+        # Remove ```json and ``` markdown fences if present
+        text = _FENCE_RE.sub("", response_text.strip())
         
         # Parse JSON
         try:
-            return json.loads(text)
-        except json.JSONDecodeError as e:
-            # Try to find JSON object in the text
-            start = text.find('{')
-            end = text.rfind('}') + 1
+            return orjson.loads(text)
+        except orjson.JSONDecodeError as e:
+            # Try to find the first JSON object in surrounding prose
+            candidate = _find_json_object(text)
             
-            if start >= 0 and end > start:
+            if candidate is not None:
                 try:
-                    return json.loads(text[start:end])
-                except json.JSONDecodeError:
+                    return orjson.loads(candidate)
+                except orjson.JSONDecodeError:
                     pass
             
             raise ValueError(f"Could not parse JSON from response: {e}")
     
     def _validate_rule_json(self, rule_json: Dict[str, Any]) -> None:
         """Validate that rule JSON has correct structure."""
-        required_keys = ["conditions", "actions", "logic"]
-        
-        for key in required_keys:
-            if key not in rule_json:
-                raise ValueError(f"Missing required key: {key}")
-        
-        if not isinstance(rule_json["conditions"], list):
-            raise ValueError("conditions must be a list")
-        
-        if not isinstance(rule_json["actions"], list):
-            raise ValueError("actions must be a list")
-        
-        if rule_json["logic"] not in ["AND", "OR"]:
-            raise ValueError("logic must be 'AND' or 'OR'")
-        
-        # Validate conditions
-        for i, condition in enumerate(rule_json["conditions"]):
-            if not isinstance(condition, dict):
-                raise ValueError(f"Condition {i} must be a dict")
-            
-            if "field" not in condition or "operator" not in condition or "value" not in condition:
-                raise ValueError(f"Condition {i} missing required keys")
-        
-        # Validate actions
-        for i, action in enumerate(rule_json["actions"]):
-            if not isinstance(action, dict):
-                raise ValueError(f"Action {i} must be a dict")
-            
-            if "type" not in action or "user" not in action or "amount_cents" not in action:
-                raise ValueError(f"Action {i} missing required keys")
+        try:
+            _validate_rule_schema(rule_json)
+        except fastjsonschema.JsonSchemaException as e:
+            raise ValueError(f"Invalid rule JSON: {e.message}")
     
     def _generate_rule_name(self, description: str) -> str:
         """Generate a rule name from description."""
@@ -237,6 +581,32 @@ Now convert the rule and return ONLY the JSON, no explanations:"""
         return name
 
 
+@functools.lru_cache(maxsize=1)
+def _shared_ai_service(http_client: Optional[httpx.AsyncClient]) -> AIService:
+    """One AIService per shared HTTP client, i.e. per app lifespan."""
+    return AIService(http_client=http_client)
+
+
+async def get_ai_service(request: Request) -> AIService:
+    """
+    FastAPI dependency providing the process-wide AIService.
+    
+    The service (Gemini client, rule caches, prompt cache handle) is built
+    once and reused. Keeping it alive also matters for the shared HTTP
+    client: a discarded genai client closes its transport when collected.
+    
+    Raises:
+        HTTPException: 400 if GEMINI_API_KEY is not configured
+    """
+    try:
+        return _shared_ai_service(getattr(request.app.state, "http", None))
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"AI service not configured: {str(e)}. Set GEMINI_API_KEY environment variable."
+        )
+
+
 # Example usage
 if __name__ == "__main__":
     # Test the service
@@ -248,12 +618,13 @@ if __name__ == "__main__":
         "Credit $100 if user completes 5 referrals and all are active",
     ]
     
-    for description in test_cases:
+    results = asyncio.run(service.natural_language_to_rules_batch(test_cases))
+    
+    for description, rule in zip(test_cases, results):
         print(f"\n📝 Input: {description}")
         
-        try:
-            rule = service.natural_language_to_rule(description)
+        if isinstance(rule, Exception):
+            print(f"❌ Error: {rule}")
+        else:
             print(f"✅ Generated Rule:")
             print(json.dumps(rule, indent=2))
-        except Exception as e:
-            print(f"❌ Error: {e}")
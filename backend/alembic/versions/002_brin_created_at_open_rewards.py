@@ -0,0 +1,36 @@
+"""Use a BRIN index on created_at and add a partial index for open rewards
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-14 07:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # BRIN on the append-only created_at: a tiny fraction of a btree's size,
+    # still effective for time-range scans since rows arrive in time order
+    op.drop_index('ix_ledger_entries_created_at', table_name='ledger_entries')
+    op.execute(
+        "CREATE INDEX ix_ledger_entries_created_at ON ledger_entries "
+        "USING BRIN (created_at) WITH (pages_per_range = 32)"
+    )
+    # Partial index for settlement sweeps: only rewards still in flight
+    op.execute(
+        "CREATE INDEX idx_reward_open ON ledger_entries (reward_id) "
+        "WHERE reward_status IN ('PENDING', 'CONFIRMED')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_reward_open', table_name='ledger_entries')
+    op.drop_index('ix_ledger_entries_created_at', table_name='ledger_entries')
+    op.create_index('ix_ledger_entries_created_at', 'ledger_entries', ['created_at'], unique=False)
@@ -0,0 +1,39 @@
+"""Replace the user_id index with a covering index for balance scans
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-14 08:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Covering index for per-user balance recomputation: the included columns
+    # allow index-only scans instead of a heap fetch per entry. It leads with
+    # user_id, so the plain user_id index is redundant.
+    op.execute(
+        "CREATE INDEX idx_user_balance_cover ON ledger_entries (user_id) "
+        "INCLUDE (amount_cents, entry_type, reward_status)"
+    )
+    op.drop_index('ix_ledger_entries_user_id', table_name='ledger_entries')
+    # Index-only scans depend on an up-to-date visibility map; vacuum this
+    # append-only table after inserts, not just after updates/deletes
+    op.execute(
+        "ALTER TABLE ledger_entries SET (autovacuum_vacuum_insert_scale_factor = 0.05)"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "ALTER TABLE ledger_entries RESET (autovacuum_vacuum_insert_scale_factor)"
+    )
+    op.create_index('ix_ledger_entries_user_id', 'ledger_entries', ['user_id'], unique=False)
+    op.drop_index('idx_user_balance_cover', table_name='ledger_entries')
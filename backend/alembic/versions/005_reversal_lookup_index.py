@@ -0,0 +1,28 @@
+"""Add partial index for reversal lookups
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-14 10:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # "Already reversed?" check on every reversal: only REVERSAL rows are
+    # indexed, so the index stays a small fraction of the table
+    op.execute(
+        "CREATE INDEX ix_reversal_related ON ledger_entries (related_entry_id) "
+        "WHERE entry_type = 'REVERSAL'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_reversal_related', table_name='ledger_entries')
@@ -0,0 +1,45 @@
+"""Move the request fingerprint out of extra_data into columns
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-14 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ledger_entries', sa.Column('request_hash', sa.String(length=64), nullable=True))
+    op.add_column(
+        'ledger_entries',
+        sa.Column('hash_algo', sa.String(length=16), nullable=False, server_default='sha256'),
+    )
+    
+    # Backfill from the JSON audit data; rows written before fingerprints
+    # existed (e.g. seed data) get an empty hash that no request can match.
+    # Rows without a recorded algorithm predate hash_algo and keep being
+    # verified as such (see LEGACY_HASH_ALGO in ledger_service).
+    op.execute(
+        "UPDATE ledger_entries SET "
+        "request_hash = COALESCE(extra_data->>'request_hash', ''), "
+        "hash_algo = COALESCE(extra_data->>'hash_algo', 'sha256-json'), "
+        "extra_data = extra_data - 'request_hash' - 'hash_algo'"
+    )
+    op.alter_column('ledger_entries', 'request_hash', nullable=False)
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE ledger_entries SET extra_data = extra_data || "
+        "jsonb_build_object('request_hash', request_hash, 'hash_algo', hash_algo)"
+    )
+    op.drop_column('ledger_entries', 'hash_algo')
+    op.drop_column('ledger_entries', 'request_hash')
@@ -0,0 +1,47 @@
+"""Promote fixed audit fields from extra_data to columns
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-14 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('ledger_entries', sa.Column('operation', sa.String(length=16), nullable=True))
+    op.add_column('ledger_entries', sa.Column('reason', sa.Text(), nullable=True))
+    
+    # Rows without an operation key (e.g. seed data) fall back to their type.
+    # original_entry_id / original_entry_type duplicate related_entry_id and
+    # the related row, and timestamp duplicates created_at
+    op.execute(
+        "UPDATE ledger_entries SET "
+        "operation = COALESCE(extra_data->>'operation', lower(entry_type::text)), "
+        "reason = extra_data->>'reason', "
+        "extra_data = extra_data - 'operation' - 'reason' - 'timestamp' "
+        "- 'original_entry_id' - 'original_entry_type'"
+    )
+    op.alter_column('ledger_entries', 'operation', nullable=False)
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE ledger_entries e SET extra_data = e.extra_data || "
+        "jsonb_build_object('operation', e.operation, "
+        "'timestamp', to_char(e.created_at, 'YYYY-MM-DD\"T\"HH24:MI:SS.US')) || "
+        "CASE WHEN e.related_entry_id IS NULL THEN '{}'::jsonb ELSE "
+        "jsonb_build_object('original_entry_id', e.related_entry_id::text, "
+        "'original_entry_type', lower(o.entry_type::text), 'reason', e.reason) END "
+        "FROM ledger_entries o WHERE o.id = COALESCE(e.related_entry_id, e.id)"
+    )
+    op.drop_column('ledger_entries', 'reason')
+    op.drop_column('ledger_entries', 'operation')
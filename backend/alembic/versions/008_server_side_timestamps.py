@@ -0,0 +1,34 @@
+"""Stamp ledger and balance rows in the database
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-14 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Transaction-start time in UTC (the columns are naive timestamps), so an
+    # entry and the balance change it causes share one stamp
+    op.alter_column(
+        'ledger_entries', 'created_at',
+        server_default=sa.text("timezone('utc', now())")
+    )
+    op.alter_column(
+        'user_balances', 'updated_at',
+        server_default=sa.text("timezone('utc', now())")
+    )
+
+
+def downgrade() -> None:
+    op.alter_column('user_balances', 'updated_at', server_default=None)
+    op.alter_column('ledger_entries', 'created_at', server_default=None)
@@ -0,0 +1,51 @@
+"""Generate time-ordered ledger entry ids in the database
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-14 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # UUIDv7 from gen_random_uuid(): 48-bit ms timestamp prefix, version 7.
+    # Keeps primary key inserts at the right edge of the btree
+    op.execute("""
+        CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid AS $$
+            SELECT encode(
+                set_bit(
+                    set_bit(
+                        overlay(
+                            uuid_send(gen_random_uuid())
+                            PLACING substring(
+                                int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint)
+                                FROM 3
+                            )
+                            FROM 1 FOR 6
+                        ),
+                        52, 1
+                    ),
+                    53, 1
+                ),
+                'hex'
+            )::uuid;
+        $$ LANGUAGE sql VOLATILE
+    """)
+    op.alter_column(
+        'ledger_entries', 'id',
+        server_default=sa.text("uuid_generate_v7()")
+    )
+
+
+def downgrade() -> None:
+    op.alter_column('ledger_entries', 'id', server_default=None)
+    op.execute("DROP FUNCTION IF EXISTS uuid_generate_v7()")
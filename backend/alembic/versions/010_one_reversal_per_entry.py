@@ -0,0 +1,34 @@
+"""Allow at most one reversal per ledger entry
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-14 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Replaces the plain partial lookup index: the reversal insert itself
+    # now fails on a second reversal, so no separate "already reversed?"
+    # query (and no race between that query and the insert)
+    op.drop_index('ix_reversal_related', table_name='ledger_entries')
+    op.execute(
+        "CREATE UNIQUE INDEX uq_one_reversal_per_entry ON ledger_entries (related_entry_id) "
+        "WHERE entry_type = 'REVERSAL'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_one_reversal_per_entry', table_name='ledger_entries')
+    op.execute(
+        "CREATE INDEX ix_reversal_related ON ledger_entries (related_entry_id) "
+        "WHERE entry_type = 'REVERSAL'"
+    )
@@ -0,0 +1,30 @@
+"""Store request fingerprints as raw bytes
+
+Revision ID: 011
+Revises: 010
+Create Date: 2026-10-14 16:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '011'
+down_revision = '010'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # 32-byte digests instead of 64 hex characters
+    op.execute(
+        "ALTER TABLE ledger_entries ALTER COLUMN request_hash TYPE bytea "
+        "USING decode(request_hash, 'hex')"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "ALTER TABLE ledger_entries ALTER COLUMN request_hash TYPE varchar(64) "
+        "USING encode(request_hash, 'hex')"
+    )
@@ -0,0 +1,26 @@
+"""Add GIN index for containment lookups on rule definitions
+
+Revision ID: 012
+Revises: 011
+Create Date: 2026-10-14 17:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '012'
+down_revision = '011'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX idx_rule_json_gin ON referral_rules "
+        "USING gin (rule_json jsonb_path_ops)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('idx_rule_json_gin', table_name='referral_rules')
@@ -0,0 +1,28 @@
+"""Generate time-ordered referral rule ids in the database
+
+Revision ID: 013
+Revises: 012
+Create Date: 2026-10-14 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '013'
+down_revision = '012'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # uuid_generate_v7() is created in 009
+    op.alter_column(
+        'referral_rules', 'id',
+        server_default=sa.text("uuid_generate_v7()")
+    )
+
+
+def downgrade() -> None:
+    op.alter_column('referral_rules', 'id', server_default=None)
@@ -0,0 +1,77 @@
+"""Store entry_type and reward_status as checked strings
+
+Revision ID: 014
+Revises: 013
+Create Date: 2026-10-14 19:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '014'
+down_revision = '013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The partial index predicates compare against enum literals; drop them
+    # before the type change and recreate them against the new values.
+    # Plain and covering indexes on these columns are rebuilt by ALTER TYPE.
+    op.drop_index('uq_one_reversal_per_entry', table_name='ledger_entries')
+    # Schemas created from the models before 002 never had this index
+    op.drop_index('idx_reward_open', table_name='ledger_entries', if_exists=True)
+    
+    # Enum labels are the member names ('CREDIT'); store the lowercase values
+    op.execute(
+        "ALTER TABLE ledger_entries "
+        "ALTER COLUMN entry_type TYPE VARCHAR(16) USING lower(entry_type::text), "
+        "ALTER COLUMN reward_status TYPE VARCHAR(16) USING lower(reward_status::text)"
+    )
+    op.execute("DROP TYPE entrytype")
+    op.execute("DROP TYPE rewardstatus")
+    
+    op.create_check_constraint(
+        'entry_type_valid', 'ledger_entries',
+        "entry_type IN ('credit', 'debit', 'reversal')"
+    )
+    op.create_check_constraint(
+        'reward_status_valid', 'ledger_entries',
+        "reward_status IN ('pending', 'confirmed', 'paid', 'reversed')"
+    )
+    
+    op.execute(
+        "CREATE UNIQUE INDEX uq_one_reversal_per_entry ON ledger_entries (related_entry_id) "
+        "WHERE entry_type = 'reversal'"
+    )
+    op.execute(
+        "CREATE INDEX idx_reward_open ON ledger_entries (reward_id) "
+        "WHERE reward_status IN ('pending', 'confirmed')"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('uq_one_reversal_per_entry', table_name='ledger_entries')
+    op.drop_index('idx_reward_open', table_name='ledger_entries', if_exists=True)
+    op.drop_constraint('reward_status_valid', 'ledger_entries', type_='check')
+    op.drop_constraint('entry_type_valid', 'ledger_entries', type_='check')
+    
+    op.execute("CREATE TYPE entrytype AS ENUM ('CREDIT', 'DEBIT', 'REVERSAL')")
+    op.execute(
+        "CREATE TYPE rewardstatus AS ENUM ('PENDING', 'CONFIRMED', 'PAID', 'REVERSED')"
+    )
+    op.execute(
+        "ALTER TABLE ledger_entries "
+        "ALTER COLUMN entry_type TYPE entrytype USING upper(entry_type)::entrytype, "
+        "ALTER COLUMN reward_status TYPE rewardstatus USING upper(reward_status)::rewardstatus"
+    )
+    
+    op.execute(
+        "CREATE UNIQUE INDEX uq_one_reversal_per_entry ON ledger_entries (related_entry_id) "
+        "WHERE entry_type = 'REVERSAL'"
+    )
+    op.execute(
+        "CREATE INDEX idx_reward_open ON ledger_entries (reward_id) "
+        "WHERE reward_status IN ('PENDING', 'CONFIRMED')"
+    )
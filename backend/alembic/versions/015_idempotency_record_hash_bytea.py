@@ -0,0 +1,30 @@
+"""Store idempotency record fingerprints as raw bytes
+
+Revision ID: 015
+Revises: 014
+Create Date: 2026-10-14 20:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '015'
+down_revision = '014'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Same 32-byte digests as ledger_entries.request_hash (see 011)
+    op.execute(
+        "ALTER TABLE idempotency_records ALTER COLUMN request_hash TYPE bytea "
+        "USING decode(request_hash, 'hex')"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "ALTER TABLE idempotency_records ALTER COLUMN request_hash TYPE varchar(64) "
+        "USING encode(request_hash, 'hex')"
+    )
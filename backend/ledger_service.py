@@ -9,66 +9,168 @@ Design Principles:
 5. Double-Entry Accounting: Credits must balance with debits
 
 Idempotency Strategy:
-- Client provides Idempotency-Key header (UUID recommended)
+- Client provides Idempotency-Key header (must be a UUID)
 - Server hashes request body + idempotency key
+- Entry is inserted with ON CONFLICT (idempotency_key) DO NOTHING, so
+  duplicates are detected atomically without a separate lookup
 - If duplicate detected: return cached response (201 -> 200)
 - Prevents: double credits, race conditions, network retry issues
 """
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from models import (
-    LedgerEntry, UserBalance, EntryType, RewardStatus, IdempotencyRecord
+    LedgerEntry, UserBalance, EntryType, RewardStatus, IdempotencyRecord,
+    utc_now
 )
 from schemas import (
     LedgerCreditRequest, LedgerDebitRequest, LedgerReversalRequest,
+    LedgerBatchCreditRequest,
     LedgerEntryResponse, IdempotentResponse
 )
+from contextlib import asynccontextmanager
 import hashlib
+import itertools
 import json
+import orjson
 import uuid
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple
+from cachetools import TTLCache
 from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+
+def _cpu_has_sha256_instructions() -> bool:
+    """True if the CPU advertises SHA-256 instructions (x86 SHA-NI, ARMv8 SHA2)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(f.read().split())
+    except OSError:
+        return False
+    return "sha_ni" in flags or "sha2" in flags
+
+
+def _canonical_json(request_data: dict) -> bytes:
+    """Sorted-key compact JSON; orjson handles UUID/enum values natively."""
+    return orjson.dumps(request_data, option=orjson.OPT_SORT_KEYS)
+
+
+def _legacy_json(request_data: dict) -> bytes:
+    """The pre-orjson serialization: json.dumps with its default ", "/": " separators."""
+    return json.dumps(request_data, sort_keys=True, default=str).encode()
+
+
+# Request fingerprint functions, keyed by the id stored in LedgerEntry.hash_algo.
+# All produce 32 raw bytes. OpenSSL-backed SHA-256 is fastest with hardware
+# support; BLAKE2b is faster in software and equally collision resistant.
+# "sha256-json" only verifies entries written before the switch to orjson;
+# new entries never use it.
+_REQUEST_HASHERS = {
+    "sha256": lambda data: hashlib.sha256(_canonical_json(data)).digest(),
+    "blake2b": lambda data: hashlib.blake2b(
+        _canonical_json(data), digest_size=32
+    ).digest(),
+    "sha256-json": lambda data: hashlib.sha256(_legacy_json(data)).digest(),
+}
+
+REQUEST_HASH_ALGO = "sha256" if _cpu_has_sha256_instructions() else "blake2b"
+
+# Recorded for entries that predate hash_algo. They were hashed with SHA-256
+# from json.dumps output or, once hashing switched to orjson, from orjson's.
+LEGACY_HASH_ALGO = "sha256-json"
+
+
+def _violated_constraint(error: IntegrityError) -> Optional[str]:
+    """Name of the constraint or unique index behind an IntegrityError."""
+    diag = getattr(error.orig, "diag", None)
+    return getattr(diag, "constraint_name", None)
 
 
 class LedgerService:
     """Service for managing financial ledger operations."""
     
-    def __init__(self, db: Session):
+    # Serialized duplicate-request responses, keyed by (idempotency_key,
+    # request_hash). Shared across requests in the process; ledger entries are
+    # immutable, so a cached body never goes stale.
+    duplicate_responses: TTLCache = TTLCache(maxsize=10_000, ttl=3600)
+    
+    # Recently read balances by user_id, for dashboards that poll. Writes in
+    # this process evict the user's entry once they commit; the short TTL
+    # bounds staleness from writes made by other workers.
+    balances: TTLCache = TTLCache(maxsize=50_000, ttl=5)
+    
+    # Invalidation generation per user_id, replaced with a fresh value from
+    # the counter whenever a write evicts the user's cached balance. A read
+    # only caches what it loaded if the generation is unchanged since it
+    # started, so a read that overlapped a commit can't re-cache the old
+    # balance after the eviction. Entries outlive any read by a wide margin.
+    balance_generations: TTLCache = TTLCache(maxsize=100_000, ttl=60)
+    _generation_counter = itertools.count(1)
+    
+    def __init__(self, db: AsyncSession):
         self.db = db
+        # Users whose balance the current transaction changes
+        self._changed_balances = set()
     
-    def _compute_request_hash(self, request_data: dict) -> str:
-        """Compute SHA-256 hash of request data for idempotency check."""
-        request_json = json.dumps(request_data, sort_keys=True)
-        return hashlib.sha256(request_json.encode()).hexdigest()
+    def duplicate_response_key(
+        self,
+        request: BaseModel,
+        idempotency_key: uuid.UUID
+    ) -> Tuple[uuid.UUID, bytes]:
+        """Cache key for the response a retry of this request would get."""
+        return idempotency_key, self._compute_request_hash(request.model_dump())
     
-    def _check_idempotency(
+    def _compute_request_hash(
+        self,
+        request_data: dict,
+        algo: str = REQUEST_HASH_ALGO
+    ) -> bytes:
+        """Compute hash of request data for idempotency check."""
+        # No stdlib json fallback for new hashes: its different output would
+        # make a mixed deployment disagree on the same request.
+        return _REQUEST_HASHERS[algo](request_data)
+    
+    def _request_matches(self, request_data: dict, algo: str, stored_hash: bytes) -> bool:
+        """True if request_data hashes to an entry's stored fingerprint."""
+        if self._compute_request_hash(request_data, algo) == stored_hash:
+            return True
+        # Legacy entries may also come from after the switch to orjson
+        return (
+            algo == LEGACY_HASH_ALGO
+            and self._compute_request_hash(request_data, "sha256") == stored_hash
+        )
+    
+    async def _check_idempotency(
         self, 
-        idempotency_key: str, 
+        idempotency_key: uuid.UUID, 
         request_data: dict
     ) -> Optional[LedgerEntry]:
         """
-        Check if request is duplicate based on idempotency key.
+        Fetch the entry stored under an idempotency key and verify the request.
+        
+        Only called once the insert has reported a conflict on the key, so
+        the happy path never pays for this lookup.
         
         Returns:
             - Existing LedgerEntry if duplicate found
-            - None if this is a new request
+            - None if no entry uses this key
         
         Raises:
             - HTTPException if idempotency key exists but request differs
         """
-        existing_entry = (
-            self.db.query(LedgerEntry)
-            .filter(LedgerEntry.idempotency_key == idempotency_key)
-            .first()
+        existing_entry = await self.db.scalar(
+            select(LedgerEntry)
+            .where(LedgerEntry.idempotency_key == idempotency_key)
         )
         
         if existing_entry:
-            # Found existing entry - verify request is identical
-            request_hash = self._compute_request_hash(request_data)
-            stored_hash = existing_entry.extra_data.get("request_hash", "")
-            
-            if request_hash != stored_hash:
+            # Found existing entry - verify request is identical, hashing
+            # with the algorithm the original entry was stored with
+            if not self._request_matches(
+                request_data, existing_entry.hash_algo, existing_entry.request_hash
+            ):
                 # Same idempotency key, different request = error
                 raise HTTPException(
                     status_code=status.HTTP_409_CONFLICT,
@@ -79,30 +181,138 @@ class LedgerService:
         
         return None
     
-    def _get_or_create_balance(self, user_id: str) -> UserBalance:
-        """Get user balance, creating if doesn't exist."""
-        balance = (
-            self.db.query(UserBalance)
-            .filter(UserBalance.user_id == user_id)
-            .with_for_update()  # Lock row for update
-            .first()
+    @asynccontextmanager
+    async def _transaction(self):
+        """
+        Commit the work done in the block, or roll it back if it raises.
+        
+        Exceptions propagate unchanged: HTTPExceptions reach FastAPI as
+        raised, anything else becomes the endpoint's 500.
+        """
+        try:
+            yield
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        finally:
+            changed, self._changed_balances = self._changed_balances, set()
+        
+        for user_id in changed:
+            self.balances.pop(user_id, None)
+            self.balance_generations[user_id] = next(self._generation_counter)
+    
+    async def _insert_entry(self, **values) -> Optional[LedgerEntry]:
+        """
+        Insert a ledger entry unless its idempotency key is already taken.
+        
+        INSERT ... ON CONFLICT (idempotency_key) DO NOTHING RETURNING detects
+        duplicates atomically in the same round trip as the insert, including
+        concurrent requests racing on the same key.
+        
+        RETURNING also hands back the server-generated columns (id,
+        created_at), and sessions don't expire objects on commit, so the
+        entry is complete without a refresh after the commit.
+        
+        Returns:
+            The new LedgerEntry, or None if the key already exists
+        """
+        stmt = (
+            pg_insert(LedgerEntry)
+            .values(**values)
+            .on_conflict_do_nothing(index_elements=[LedgerEntry.idempotency_key])
+            .returning(LedgerEntry)
         )
+        return await self.db.scalar(stmt)
+    
+    async def _duplicate_entry(
+        self,
+        idempotency_key: uuid.UUID,
+        request_data: dict
+    ) -> LedgerEntry:
+        """Return the entry a conflicting insert collided with."""
+        # End the current transaction first (releasing any locks) - the
+        # conflicting row is committed, so a fresh snapshot sees it
+        await self.db.rollback()
         
-        if not balance:
-            balance = UserBalance(
-                user_id=user_id,
-                balance_cents=0,
-                version=1
+        entry = await self._check_idempotency(idempotency_key, request_data)
+        if entry is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Idempotency key conflict but no entry found"
             )
-            self.db.add(balance)
-            self.db.flush()  # Get ID without committing
+        return entry
+    
+    async def _credit_balance(self, user_id: str, amount_cents: int) -> int:
+        """
+        Atomically add to a user's balance, creating the row on first use.
         
-        return balance
+        One INSERT ... ON CONFLICT DO UPDATE does the arithmetic in the
+        database: no SELECT ... FOR UPDATE round trip, no read-modify-write
+        in Python, and concurrent first-time credits can't collide.
+        
+        Returns:
+            The new balance in cents
+        """
+        stmt = self._balance_credit_stmt({user_id: amount_cents})
+        return await self.db.scalar(stmt.returning(UserBalance.balance_cents))
+    
+    def _balance_credit_stmt(self, deltas: Dict[str, int]):
+        """
+        Build the balance upsert adding each user's delta.
+        
+        Users are emitted in sorted order so concurrent multi-user upserts
+        take row locks in the same order and can't deadlock each other.
+        """
+        self._changed_balances.update(deltas)
+        stmt = pg_insert(UserBalance).values([
+            {
+                "user_id": user_id,
+                "balance_cents": deltas[user_id],
+                "version": 1
+            }
+            for user_id in sorted(deltas)
+        ])
+        return stmt.on_conflict_do_update(
+            index_elements=[UserBalance.user_id],
+            set_={
+                "balance_cents": UserBalance.balance_cents + stmt.excluded.balance_cents,
+                "version": UserBalance.version + 1,
+                "updated_at": utc_now()
+            }
+        )
+    
+    async def _debit_balance(self, user_id: str, amount_cents: int) -> Optional[int]:
+        """
+        Atomically subtract from a user's balance if it covers the amount.
+        
+        The sufficiency check is part of the UPDATE's WHERE clause, so it
+        can't race with a concurrent debit.
+        
+        Returns:
+            The new balance in cents, or None if the balance is insufficient
+            (or the user has no balance yet)
+        """
+        self._changed_balances.add(user_id)
+        stmt = (
+            update(UserBalance)
+            .where(
+                UserBalance.user_id == user_id,
+                UserBalance.balance_cents >= amount_cents
+            )
+            .values(
+                balance_cents=UserBalance.balance_cents - amount_cents,
+                version=UserBalance.version + 1,
+                updated_at=utc_now()
+            )
+            .returning(UserBalance.balance_cents)
+        )
+        return await self.db.scalar(stmt)
     
-    def credit(
+    async def credit(
         self, 
         request: LedgerCreditRequest, 
-        idempotency_key: str
+        idempotency_key: uuid.UUID
     ) -> Tuple[LedgerEntry, bool]:
         """
         Credit a user's account with strict idempotency.
@@ -121,77 +331,123 @@ class LedgerService:
         request_data = request.model_dump()
         request_hash = self._compute_request_hash(request_data)
         
-        # Check for duplicate request
-        existing_entry = self._check_idempotency(idempotency_key, request_data)
-        if existing_entry:
-            return existing_entry, True  # Duplicate - return cached
-        
-        try:
-            # Get or create user balance (with row lock)
-            user_balance = self._get_or_create_balance(request.user_id)
-            
-            # Add extra_data for audit trail
-            entry_extra_data = {
-                **request.extra_data,
-                "request_hash": request_hash,
-                "operation": "credit",
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # Create immutable ledger entry
-            ledger_entry = LedgerEntry(
-                id=uuid.uuid4(),
+        async with self._transaction():
+            # Create immutable ledger entry (no-op if the key was used before)
+            ledger_entry = await self._insert_entry(
                 user_id=request.user_id,
                 entry_type=EntryType.CREDIT,
                 amount_cents=request.amount_cents,
                 reward_id=request.reward_id,
                 reward_status=request.reward_status or RewardStatus.PENDING,
                 idempotency_key=idempotency_key,
-                extra_data=entry_extra_data,
-                created_at=datetime.utcnow()
+                request_hash=request_hash,
+                hash_algo=REQUEST_HASH_ALGO,
+                operation="credit",
+                extra_data=request.extra_data
             )
             
-            # Update balance atomically
-            user_balance.balance_cents += request.amount_cents
-            user_balance.version += 1
-            user_balance.updated_at = datetime.utcnow()
-            
-            # Add to session
-            self.db.add(ledger_entry)
+            if ledger_entry is None:
+                # Duplicate request - return cached
+                return await self._duplicate_entry(idempotency_key, request_data), True
             
-            # Commit transaction (ACID guarantee)
-            self.db.commit()
-            self.db.refresh(ledger_entry)
+            # Update balance atomically - last statement before the commit,
+            # so the user's balance row stays locked for one round trip
+            await self._credit_balance(request.user_id, request.amount_cents)
             
             return ledger_entry, False
+    
+    async def batch_credit(
+        self,
+        request: LedgerBatchCreditRequest,
+        idempotency_key: uuid.UUID
+    ) -> Tuple[List[LedgerEntry], bool]:
+        """
+        Credit many accounts in a single transaction.
+        
+        All entries go in through one multi-row INSERT ... ON CONFLICT DO
+        NOTHING and all balances through one multi-row upsert (credits to
+        the same user are summed first), so a batch costs one commit instead
+        of one per credit.
+        
+        Each item is stored under a key derived from the batch key and its
+        position, and every entry carries the hash of the whole batch - a
+        retried batch matches all of its entries, a different batch under
+        the same key cannot.
+        
+        Args:
+            request: Credits to apply
+            idempotency_key: Unique key for the batch as a whole
+        
+        Returns:
+            Tuple of (entries in request order, is_duplicate)
+        
+        Raises:
+            HTTPException on validation or idempotency errors
+        """
+        request_data = request.model_dump()
+        request_hash = self._compute_request_hash(request_data)
+        item_keys = [
+            uuid.uuid5(idempotency_key, str(position))
+            for position in range(len(request.items))
+        ]
+        
+        async with self._transaction():
+            rows = [
+                {
+                    "user_id": item.user_id,
+                    "entry_type": EntryType.CREDIT,
+                    "amount_cents": item.amount_cents,
+                    "reward_id": item.reward_id,
+                    "reward_status": item.reward_status or RewardStatus.PENDING,
+                    "idempotency_key": item_key,
+                    "request_hash": request_hash,
+                    "hash_algo": REQUEST_HASH_ALGO,
+                    "operation": "credit",
+                    "extra_data": item.extra_data
+                }
+                for item, item_key in zip(request.items, item_keys)
+            ]
             
-        except IntegrityError as e:
-            self.db.rollback()
-            # Handle race condition on idempotency key
-            if "idempotency_key" in str(e):
-                # Another request won the race - fetch and return
-                entry = (
-                    self.db.query(LedgerEntry)
-                    .filter(LedgerEntry.idempotency_key == idempotency_key)
-                    .first()
-                )
-                if entry:
-                    return entry, True
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Database error: {str(e)}"
-            )
-        except Exception as e:
-            self.db.rollback()
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Unexpected error: {str(e)}"
+            stmt = (
+                pg_insert(LedgerEntry)
+                .on_conflict_do_nothing(index_elements=[LedgerEntry.idempotency_key])
+                .returning(LedgerEntry)
             )
+            entries = list(await self.db.scalars(stmt, rows))
+            
+            if len(entries) != len(rows):
+                # Some keys were taken - only an identical, fully committed
+                # batch counts as a duplicate
+                await self.db.rollback()
+                entries = list(await self.db.scalars(
+                    select(LedgerEntry)
+                    .where(LedgerEntry.idempotency_key.in_(item_keys))
+                ))
+                if len(entries) != len(rows) or any(
+                    entry.request_hash
+                    != self._compute_request_hash(request_data, entry.hash_algo)
+                    for entry in entries
+                ):
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="Idempotency key already used with different request"
+                    )
+                is_duplicate = True
+            else:
+                deltas: Dict[str, int] = {}
+                for item in request.items:
+                    deltas[item.user_id] = deltas.get(item.user_id, 0) + item.amount_cents
+                await self.db.execute(self._balance_credit_stmt(deltas))
+                is_duplicate = False
+            
+            position = {item_key: i for i, item_key in enumerate(item_keys)}
+            entries.sort(key=lambda entry: position[entry.idempotency_key])
+            return entries, is_duplicate
     
-    def debit(
+    async def debit(
         self, 
         request: LedgerDebitRequest, 
-        idempotency_key: str
+        idempotency_key: uuid.UUID
     ) -> Tuple[LedgerEntry, bool]:
         """
         Debit a user's account with strict idempotency.
@@ -201,79 +457,40 @@ class LedgerService:
         request_data = request.model_dump()
         request_hash = self._compute_request_hash(request_data)
         
-        # Check for duplicate
-        existing_entry = self._check_idempotency(idempotency_key, request_data)
-        if existing_entry:
-            return existing_entry, True
-        
-        try:
-            # Get balance with lock
-            user_balance = self._get_or_create_balance(request.user_id)
-            
-            # Validate sufficient balance
-            if user_balance.balance_cents < request.amount_cents:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Insufficient balance. Available: {user_balance.balance_cents} cents, Required: {request.amount_cents} cents"
-                )
-            
-            # Create ledger entry
-            entry_extra_data = {
-                **request.extra_data,
-                "request_hash": request_hash,
-                "operation": "debit",
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            ledger_entry = LedgerEntry(
-                id=uuid.uuid4(),
+        async with self._transaction():
+            # Create ledger entry first, so a retried debit is recognized as a
+            # duplicate even if the balance has since dropped
+            ledger_entry = await self._insert_entry(
                 user_id=request.user_id,
                 entry_type=EntryType.DEBIT,
                 amount_cents=request.amount_cents,
                 idempotency_key=idempotency_key,
-                extra_data=entry_extra_data,
-                created_at=datetime.utcnow()
+                request_hash=request_hash,
+                hash_algo=REQUEST_HASH_ALGO,
+                operation="debit",
+                extra_data=request.extra_data
             )
             
-            # Update balance
-            user_balance.balance_cents -= request.amount_cents
-            user_balance.version += 1
-            user_balance.updated_at = datetime.utcnow()
+            if ledger_entry is None:
+                return await self._duplicate_entry(idempotency_key, request_data), True
             
-            self.db.add(ledger_entry)
-            self.db.commit()
-            self.db.refresh(ledger_entry)
+            # Update balance if sufficient (rollback discards the entry)
+            if await self._debit_balance(request.user_id, request.amount_cents) is None:
+                available = await self.db.scalar(
+                    select(UserBalance.balance_cents)
+                    .where(UserBalance.user_id == request.user_id)
+                )
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Insufficient balance. Available: {available or 0} cents, Required: {request.amount_cents} cents"
+                )
             
             return ledger_entry, False
-            
-        except IntegrityError as e:
-            self.db.rollback()
-            if "idempotency_key" in str(e):
-                entry = (
-                    self.db.query(LedgerEntry)
-                    .filter(LedgerEntry.idempotency_key == idempotency_key)
-                    .first()
-                )
-                if entry:
-                    return entry, True
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Database error: {str(e)}"
-            )
-        except HTTPException:
-            self.db.rollback()
-            raise
-        except Exception as e:
-            self.db.rollback()
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Unexpected error: {str(e)}"
-            )
     
-    def reverse(
+    async def reverse(
         self, 
         request: LedgerReversalRequest, 
-        idempotency_key: str
+        idempotency_key: uuid.UUID
     ) -> Tuple[LedgerEntry, bool]:
         """
         Reverse a previous ledger entry by creating an offsetting entry.
@@ -287,17 +504,11 @@ class LedgerService:
         request_data = request.model_dump()
         request_hash = self._compute_request_hash(request_data)
         
-        # Check for duplicate
-        existing_entry = self._check_idempotency(idempotency_key, request_data)
-        if existing_entry:
-            return existing_entry, True
-        
-        try:
+        async with self._transaction():
             # Fetch original entry
-            original_entry = (
-                self.db.query(LedgerEntry)
-                .filter(LedgerEntry.id == request.entry_id)
-                .first()
+            original_entry = await self.db.scalar(
+                select(LedgerEntry)
+                .where(LedgerEntry.id == request.entry_id)
             )
             
             if not original_entry:
@@ -306,127 +517,132 @@ class LedgerService:
                     detail=f"Ledger entry {request.entry_id} not found"
                 )
             
-            # Check if already reversed
-            existing_reversal = (
-                self.db.query(LedgerEntry)
-                .filter(
-                    LedgerEntry.entry_type == EntryType.REVERSAL,
-                    LedgerEntry.related_entry_id == request.entry_id
+            # Create reversal entry (no-op if the key was used before). The
+            # original's id and type are reachable through related_entry_id.
+            # uq_one_reversal_per_entry rejects a second reversal of the same
+            # entry atomically, even when two reversals race
+            try:
+                reversal_entry = await self._insert_entry(
+                    user_id=original_entry.user_id,
+                    entry_type=EntryType.REVERSAL,
+                    amount_cents=original_entry.amount_cents,
+                    reward_id=original_entry.reward_id,
+                    reward_status=RewardStatus.REVERSED if original_entry.reward_status else None,
+                    idempotency_key=idempotency_key,
+                    request_hash=request_hash,
+                    hash_algo=REQUEST_HASH_ALGO,
+                    related_entry_id=original_entry.id,
+                    operation="reversal",
+                    reason=request.reason,
+                    extra_data=request.extra_data
                 )
-                .first()
-            )
-            
-            if existing_reversal:
+            except IntegrityError as e:
+                if _violated_constraint(e) != "uq_one_reversal_per_entry":
+                    raise
                 raise HTTPException(
                     status_code=status.HTTP_409_CONFLICT,
                     detail=f"Entry {request.entry_id} already reversed"
                 )
             
-            # Get user balance with lock
-            user_balance = self._get_or_create_balance(original_entry.user_id)
-            
-            # Create reversal entry
-            entry_extra_data = {
-                **request.extra_data,
-                "request_hash": request_hash,
-                "operation": "reversal",
-                "original_entry_id": str(original_entry.id),
-                "original_entry_type": original_entry.entry_type.value,
-                "reason": request.reason,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            reversal_entry = LedgerEntry(
-                id=uuid.uuid4(),
-                user_id=original_entry.user_id,
-                entry_type=EntryType.REVERSAL,
-                amount_cents=original_entry.amount_cents,
-                reward_id=original_entry.reward_id,
-                reward_status=RewardStatus.REVERSED if original_entry.reward_status else None,
-                idempotency_key=idempotency_key,
-                related_entry_id=original_entry.id,
-                extra_data=entry_extra_data,
-                created_at=datetime.utcnow()
-            )
+            if reversal_entry is None:
+                return await self._duplicate_entry(idempotency_key, request_data), True
             
             # Adjust balance (opposite of original)
             if original_entry.entry_type == EntryType.CREDIT:
                 # Reversing a credit = debit
-                if user_balance.balance_cents < original_entry.amount_cents:
+                new_balance = await self._debit_balance(
+                    original_entry.user_id, original_entry.amount_cents
+                )
+                if new_balance is None:
                     raise HTTPException(
                         status_code=status.HTTP_400_BAD_REQUEST,
                         detail="Insufficient balance to reverse credit"
                     )
-                user_balance.balance_cents -= original_entry.amount_cents
             elif original_entry.entry_type == EntryType.DEBIT:
                 # Reversing a debit = credit
-                user_balance.balance_cents += original_entry.amount_cents
-            
-            user_balance.version += 1
-            user_balance.updated_at = datetime.utcnow()
-            
-            self.db.add(reversal_entry)
-            self.db.commit()
-            self.db.refresh(reversal_entry)
+                await self._credit_balance(
+                    original_entry.user_id, original_entry.amount_cents
+                )
             
             return reversal_entry, False
-            
-        except IntegrityError as e:
-            self.db.rollback()
-            if "idempotency_key" in str(e):
-                entry = (
-                    self.db.query(LedgerEntry)
-                    .filter(LedgerEntry.idempotency_key == idempotency_key)
-                    .first()
-                )
-                if entry:
-                    return entry, True
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Database error: {str(e)}"
-            )
-        except HTTPException:
-            self.db.rollback()
-            raise
-        except Exception as e:
-            self.db.rollback()
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Unexpected error: {str(e)}"
-            )
     
-    def get_entries(
+    async def get_entries(
         self, 
         user_id: Optional[str] = None,
         limit: int = 100,
         offset: int = 0
-    ) -> List[LedgerEntry]:
-        """Fetch ledger entries with optional user filter."""
-        query = self.db.query(LedgerEntry)
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Fetch ledger entries with optional user filter.
+        
+        Rows are read through a Core select on the table and returned as
+        plain dicts keyed by column name - read-only pages skip ORM object
+        hydration and identity-map bookkeeping entirely.
+        
+        Returns:
+            Tuple of (entries on this page, total matching entries). The total
+            comes from a COUNT(*) OVER () window on the same query, so the
+            filter is evaluated once rather than in a second COUNT query.
+        """
+        table = LedgerEntry.__table__
+        # The request fingerprint is internal to idempotency checks
+        columns = [
+            c for c in table.c if c.name not in ("request_hash", "hash_algo")
+        ]
+        query = select(*columns, func.count().over().label("total"))
         
         if user_id:
-            query = query.filter(LedgerEntry.user_id == user_id)
+            query = query.where(table.c.user_id == user_id)
         
-        query = query.order_by(LedgerEntry.created_at.desc())
+        query = query.order_by(table.c.created_at.desc())
         query = query.offset(offset).limit(limit)
         
-        return query.all()
+        rows = (await self.db.execute(query)).mappings().all()
+        
+        if rows:
+            total = rows[0]["total"]
+            entries = [dict(row) for row in rows]
+            for entry in entries:
+                del entry["total"]
+            return entries, total
+        if offset == 0:
+            return [], 0
+        
+        # Page past the end: no rows to carry the window total, count directly
+        count_query = select(func.count()).select_from(table)
+        if user_id:
+            count_query = count_query.where(table.c.user_id == user_id)
+        return [], await self.db.scalar(count_query)
     
-    def get_balance(self, user_id: str) -> UserBalance:
-        """Get user's current balance."""
-        balance = (
-            self.db.query(UserBalance)
-            .filter(UserBalance.user_id == user_id)
-            .first()
+    async def get_balance(self, user_id: str) -> UserBalance:
+        """
+        Get user's current balance.
+        
+        Served from the process-wide balance cache when possible. Cached
+        values are detached snapshots, never objects bound to a session.
+        """
+        balance = self.balances.get(user_id)
+        if balance is not None:
+            return balance
+        
+        generation = self.balance_generations.get(user_id)
+        
+        row = await self.db.scalar(
+            select(UserBalance)
+            .where(UserBalance.user_id == user_id)
         )
         
-        if not balance:
-            # Create zero balance if user doesn't exist
-            balance = UserBalance(
-                user_id=user_id,
-                balance_cents=0,
-                version=1,
-                updated_at=datetime.utcnow()
-            )
+        # Zero balance if the user doesn't exist yet
+        balance = UserBalance(
+            user_id=user_id,
+            balance_cents=row.balance_cents if row else 0,
+            version=row.version if row else 1,
+            updated_at=row.updated_at if row else datetime.utcnow()
+        )
+        
+        # A write committed while this read was in flight; what was loaded
+        # may predate it, so leave the cache empty for the next read
+        if self.balance_generations.get(user_id) == generation:
+            self.balances[user_id] = balance
         
         return balance
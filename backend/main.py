@@ -7,24 +7,46 @@ This application implements a production-grade financial ledger with:
 - ACID transaction support
 - Rule-based referral engine
 """
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends, Header, HTTPException, status, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List
+import httpx
+import logging
+import orjson
 import uuid
 
 from config import settings
-from database import get_db
+from database import engine, get_db, pool_status, warm_pool
 from schemas import (
     LedgerCreditRequest, LedgerDebitRequest, LedgerReversalRequest,
-    LedgerEntryResponse, UserBalanceResponse, LedgerEntriesResponse,
-    IdempotentResponse, ErrorResponse
+    LedgerBatchCreditRequest, LedgerEntryResponse, UserBalanceResponse,
+    LedgerEntriesResponse, IdempotentResponse, IdempotentBatchResponse,
+    ErrorResponse
 )
 from ledger_service import LedgerService
 from models import EntryType
 from rule_api import router as rule_router
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create process-wide resources on startup and release them on shutdown."""
+    # One pooled HTTP/2 client for all outbound Gemini calls, so TCP connections
+    # and TLS sessions are reused instead of renegotiated per request
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, keepalive_expiry=30),
+    )
+    await warm_pool()
+    yield
+    await app.state.http.aclose()
+    await engine.dispose()
+
 
 app = FastAPI(
     title="PineOS Referral System API",
@@ -40,12 +62,14 @@ app = FastAPI(
     
     ## Idempotency
     All mutation endpoints (POST) require an `Idempotency-Key` header.
-    Use a UUID v4 for each unique request. Retrying with the same key
+    The key must be a UUID (v4 recommended); any other string is rejected
+    with 422. Use a new key for each unique request. Retrying with the same key
     returns the cached response without re-executing the operation.
     """,
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -87,10 +111,68 @@ async def health_check():
     return {"status": "healthy", "service": "pineos-referral-system"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime metrics for monitoring (database connection pool usage)."""
+    return {"db_pool": pool_status()}
+
+
 # ============================================================================
 # LEDGER ENDPOINTS
 # ============================================================================
 
+async def _idempotent_response(
+    service,
+    operation,
+    request,
+    idempotency_key,
+    to_data=LedgerEntryResponse.model_validate,
+    wrapper=IdempotentResponse
+):
+    """
+    Run a ledger mutation and render its idempotent response.
+    
+    Known duplicates are answered from the service's response cache without
+    touching the database; every served entry primes that cache with the
+    body a retry would get.
+    
+    Args:
+        to_data: Converts the operation's result into the response data
+        wrapper: Response model wrapping data and is_duplicate
+    """
+    cache_key = service.duplicate_response_key(request, idempotency_key)
+    cached_body = service.duplicate_responses.get(cache_key)
+    
+    if cached_body is not None:
+        return Response(
+            content=cached_body,
+            status_code=status.HTTP_200_OK,
+            media_type="application/json"
+        )
+    
+    result, is_duplicate = await operation(request, idempotency_key)
+    data = to_data(result)
+    
+    # orjson serializes the UUIDs, datetimes and enums in the dump natively
+    duplicate_body = orjson.dumps(
+        wrapper(data=data, is_duplicate=True).model_dump()
+    )
+    service.duplicate_responses[cache_key] = duplicate_body
+    
+    if is_duplicate:
+        return Response(
+            content=duplicate_body,
+            status_code=status.HTTP_200_OK,
+            media_type="application/json"
+        )
+    
+    return ORJSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content=wrapper(data=data, is_duplicate=False).model_dump()
+    )
+
+
+
 @app.post(
     f"{settings.API_V1_PREFIX}/ledger/credit",
     response_model=IdempotentResponse,
@@ -105,7 +187,7 @@ async def health_check():
     description="""
     Credit a user's account with strict idempotency guarantees.
     
-    **Idempotency**: Requires `Idempotency-Key` header (UUID recommended).
+    **Idempotency**: Requires `Idempotency-Key` header (UUID).
     Duplicate requests return cached response with HTTP 200 instead of 201.
     
     **ACID**: Balance updates are atomic with ledger entry creation.
@@ -115,39 +197,53 @@ async def health_check():
 )
 async def credit_account(
     request: LedgerCreditRequest,
-    idempotency_key: str = Header(..., description="Unique key to prevent duplicate operations"),
-    db: Session = Depends(get_db)
+    idempotency_key: uuid.UUID = Header(..., description="Unique key (UUID) to prevent duplicate operations"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Credit a user's account."""
     service = LedgerService(db)
     
-    try:
-        entry, is_duplicate = service.credit(request, idempotency_key)
-        
-        response = IdempotentResponse(
-            data=LedgerEntryResponse.from_orm(entry),
-            is_duplicate=is_duplicate
-        )
-        
-        # Always use JSONResponse with explicit serialization
-        if is_duplicate:
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content=response.model_dump(mode='json')
-            )
-        
-        return JSONResponse(
-            status_code=status.HTTP_201_CREATED,
-            content=response.model_dump(mode='json')
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
+    return await _idempotent_response(
+        service, service.credit, request, idempotency_key
+    )
+
+
+@app.post(
+    f"{settings.API_V1_PREFIX}/ledger/credit:batch",
+    response_model=IdempotentBatchResponse,
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        201: {"description": "All credits successfully applied"},
+        200: {"description": "Duplicate request - returning cached response"},
+        409: {"description": "Idempotency key conflict"},
+        422: {"description": "Validation error"}
+    },
+    summary="Credit many accounts at once",
+    description="""
+    Apply up to 1000 credits in a single transaction - all or nothing.
+    
+    **Idempotency**: Requires `Idempotency-Key` header (UUID) for the batch.
+    Each entry's key is derived from it and the item's position.
+    
+    **Throughput**: One multi-row insert, one balance upsert and one commit
+    per batch, instead of one of each per credit.
+    """
+)
+async def batch_credit_accounts(
+    request: LedgerBatchCreditRequest,
+    idempotency_key: uuid.UUID = Header(..., description="Unique key (UUID) to prevent duplicate operations"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Credit many accounts in one transaction."""
+    service = LedgerService(db)
+    
+    return await _idempotent_response(
+        service, service.batch_credit, request, idempotency_key,
+        to_data=lambda entries: [
+            LedgerEntryResponse.model_validate(entry) for entry in entries
+        ],
+        wrapper=IdempotentBatchResponse
+    )
 
 
 @app.post(
@@ -171,39 +267,15 @@ async def credit_account(
 )
 async def debit_account(
     request: LedgerDebitRequest,
-    idempotency_key: str = Header(..., description="Unique key to prevent duplicate operations"),
-    db: Session = Depends(get_db)
+    idempotency_key: uuid.UUID = Header(..., description="Unique key (UUID) to prevent duplicate operations"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Debit a user's account."""
     service = LedgerService(db)
     
-    try:
-        entry, is_duplicate = service.debit(request, idempotency_key)
-        
-        response = IdempotentResponse(
-            data=LedgerEntryResponse.from_orm(entry),
-            is_duplicate=is_duplicate
-        )
-        
-        # Always use JSONResponse with explicit serialization
-        if is_duplicate:
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content=response.model_dump(mode='json')
-            )
-        
-        return JSONResponse(
-            status_code=status.HTTP_201_CREATED,
-            content=response.model_dump(mode='json')
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
+    return await _idempotent_response(
+        service, service.debit, request, idempotency_key
+    )
 
 
 @app.post(
@@ -229,39 +301,15 @@ async def debit_account(
 )
 async def reverse_entry(
     request: LedgerReversalRequest,
-    idempotency_key: str = Header(..., description="Unique key to prevent duplicate operations"),
-    db: Session = Depends(get_db)
+    idempotency_key: uuid.UUID = Header(..., description="Unique key (UUID) to prevent duplicate operations"),
+    db: AsyncSession = Depends(get_db)
 ):
     """Reverse a ledger entry."""
     service = LedgerService(db)
     
-    try:
-        entry, is_duplicate = service.reverse(request, idempotency_key)
-        
-        response = IdempotentResponse(
-            data=LedgerEntryResponse.from_orm(entry),
-            is_duplicate=is_duplicate
-        )
-        
-        # Always use JSONResponse with explicit serialization
-        if is_duplicate:
-            return JSONResponse(
-                status_code=status.HTTP_200_OK,
-                content=response.model_dump(mode='json')
-            )
-        
-        return JSONResponse(
-            status_code=status.HTTP_201_CREATED,
-            content=response.model_dump(mode='json')
-        )
-        
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=str(e)
-        )
+    return await _idempotent_response(
+        service, service.reverse, request, idempotency_key
+    )
 
 
 @app.get(
@@ -274,41 +322,42 @@ async def get_entries(
     user_id: Optional[str] = Query(None, description="Filter by user ID"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum entries to return"),
     offset: int = Query(0, ge=0, description="Number of entries to skip"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get ledger entries with optional filtering."""
     service = LedgerService(db)
     
-    entries = service.get_entries(user_id=user_id, limit=limit, offset=offset)
-    
-    # Get total count
-    from models import LedgerEntry
-    query = db.query(LedgerEntry)
-    if user_id:
-        query = query.filter(LedgerEntry.user_id == user_id)
-    total = query.count()
+    entries, total = await service.get_entries(user_id=user_id, limit=limit, offset=offset)
     
-    return LedgerEntriesResponse(
-        entries=[LedgerEntryResponse.from_orm(e) for e in entries],
-        total=total,
-        page=offset // limit + 1 if limit > 0 else 1,
-        page_size=limit
-    )
+    # Entry dicts are keyed like LedgerEntryResponse; orjson renders their
+    # UUIDs, enums and datetimes directly, without a model per row
+    return ORJSONResponse(content={
+        "entries": entries,
+        "total": total,
+        "page": offset // limit + 1 if limit > 0 else 1,
+        "page_size": limit
+    })
 
 
 @app.get(
     f"{settings.API_V1_PREFIX}/ledger/balance/{{user_id}}",
     response_model=UserBalanceResponse,
     summary="Get user balance",
-    description="Fetch current balance for a user."
+    description="""
+    Fetch current balance for a user.
+    
+    Balances are cached per process for up to 5 seconds. A write through the
+    same process is visible immediately; writes through other workers may
+    take up to the cache TTL to show.
+    """
 )
 async def get_balance(
     user_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get user's current balance."""
     service = LedgerService(db)
-    balance = service.get_balance(user_id)
+    balance = await service.get_balance(user_id)
     
     return UserBalanceResponse.from_db(balance)
 
@@ -320,12 +369,22 @@ async def get_balance(
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
     """Custom error response format."""
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content=ErrorResponse(
             error=exc.detail,
             detail=getattr(exc, "detail", None)
-        ).model_dump(mode='json')
+        ).model_dump()
+    )
+
+
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request, exc):
+    """Log unexpected errors and return a generic 500 without driver details."""
+    logger.exception("Unhandled error on %s %s", request.method, request.url.path)
+    return ORJSONResponse(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        content=ErrorResponse(error="Internal server error").model_dump()
     )
 
 
@@ -8,19 +8,67 @@ Key Design Principles:
 4. Idempotency: Duplicate requests are detected via idempotency_key
 """
 from sqlalchemy import (
-    Column, String, Integer, BigInteger, Enum, DateTime, 
-    ForeignKey, Index, CheckConstraint, UniqueConstraint, Text
+    Column, String, Integer, BigInteger, DateTime, LargeBinary,
+    DDL, ForeignKey, Index, CheckConstraint, UniqueConstraint, Text, event,
+    func, text
 )
 from sqlalchemy.dialects.postgresql import JSONB, UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import backref, relationship
 from datetime import datetime
 import enum
-import uuid
 from database import Base
 
 
+def utc_now():
+    """
+    Database-side UTC timestamp for naive DateTime columns.
+    
+    now() is the transaction start time, so every row a transaction writes
+    (ledger entry and balance alike) carries the same stamp.
+    """
+    return func.timezone("utc", func.now())
+
+
+# Time-ordered UUIDv7 (RFC 9562) built on gen_random_uuid(): the leading 48
+# bits become the Unix time in ms and the version nibble flips from 4 to 7.
+# Postgres 15 has no native uuidv7() and the pg_uuidv7 extension isn't in
+# the stock image.
+UUID_V7_FUNCTION = """
+CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid AS $$
+    SELECT encode(
+        set_bit(
+            set_bit(
+                overlay(
+                    uuid_send(gen_random_uuid())
+                    PLACING substring(
+                        int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint)
+                        FROM 3
+                    )
+                    FROM 1 FOR 6
+                ),
+                52, 1
+            ),
+            53, 1
+        ),
+        'hex'
+    )::uuid;
+$$ LANGUAGE sql VOLATILE
+"""
+
+event.listen(Base.metadata, "before_create", DDL(UUID_V7_FUNCTION))
+event.listen(
+    Base.metadata, "after_drop", DDL("DROP FUNCTION IF EXISTS uuid_generate_v7()")
+)
+
+
 class EntryType(str, enum.Enum):
-    """Types of ledger entries."""
+    """
+    Types of ledger entries.
+    
+    Stored as the plain lowercase value in a String column (checked by the
+    entry_type_valid constraint), so reads hand back str with no per-row
+    enum coercion; members compare equal to those strings.
+    """
     CREDIT = "credit"
     DEBIT = "debit"
     REVERSAL = "reversal"
@@ -42,36 +90,78 @@ class LedgerEntry(Base):
     - Immutable: Once created, entries are never modified
     - amount_cents: Stored as integer to avoid floating-point errors
     - idempotency_key: Ensures duplicate requests don't create duplicate entries
+      (native UUID, 16 bytes, so its unique index stays small)
     - related_entry_id: Links reversals to original entries
     - extra_data: Flexible JSONB for audit trail and context
     """
     __tablename__ = "ledger_entries"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    user_id = Column(String(255), nullable=False, index=True)
-    entry_type = Column(Enum(EntryType), nullable=False)
+    # Generated in the database: time-ordered ids append to the right edge
+    # of the primary key index instead of landing on random pages
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("uuid_generate_v7()"))
+    user_id = Column(String(255), nullable=False)
+    entry_type = Column(String(16), nullable=False)  # EntryType value
     amount_cents = Column(BigInteger, nullable=False)  # Money in cents to avoid float issues
     
     # Reward tracking
     reward_id = Column(String(255), nullable=True, index=True)
-    reward_status = Column(Enum(RewardStatus), nullable=True)
+    reward_status = Column(String(16), nullable=True)  # RewardStatus value
     
     # Idempotency and relationships
-    idempotency_key = Column(String(255), nullable=False, unique=True, index=True)
+    idempotency_key = Column(UUID(as_uuid=True), nullable=False, unique=True, index=True)
+    request_hash = Column(LargeBinary(32), nullable=False)  # Raw digest of the request body
+    hash_algo = Column(String(16), nullable=False, server_default="sha256")
     related_entry_id = Column(UUID(as_uuid=True), ForeignKey("ledger_entries.id"), nullable=True)
     
-    # Audit data (renamed from 'metadata' to avoid SQLAlchemy reserved attribute)
+    # Audit data: fixed fields as columns, caller-supplied context in extra_data
+    # (renamed from 'metadata' to avoid SQLAlchemy reserved attribute)
+    operation = Column(String(16), nullable=False)  # credit / debit / reversal
+    reason = Column(Text, nullable=True)  # Reversals only
     extra_data = Column(JSONB, nullable=False, default=dict)
-    created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
-    
-    # Relationships
-    related_entry = relationship("LedgerEntry", remote_side=[id], backref="reversals")
+    created_at = Column(DateTime, nullable=False, server_default=utc_now())
+    
+    # Relationships. Never loaded implicitly: an async session can't lazy
+    # load, and a per-entry load would be an N+1. Callers that need them ask
+    # for a batched load, e.g. .options(selectinload(LedgerEntry.reversals))
+    related_entry = relationship(
+        "LedgerEntry", remote_side=[id], lazy="raise",
+        backref=backref("reversals", lazy="raise")
+    )
     
     # Constraints
     __table_args__ = (
         CheckConstraint("amount_cents > 0", name="positive_amount"),
+        CheckConstraint(
+            "entry_type IN ('credit', 'debit', 'reversal')", name="entry_type_valid"
+        ),
+        CheckConstraint(
+            "reward_status IN ('pending', 'confirmed', 'paid', 'reversed')",
+            name="reward_status_valid",
+        ),
         Index("idx_user_created", "user_id", "created_at"),
         Index("idx_reward", "reward_id", "reward_status"),
+        # Covering index: balance recomputation by user is an index-only scan
+        Index(
+            "idx_user_balance_cover", "user_id",
+            postgresql_include=["amount_cents", "entry_type", "reward_status"],
+        ),
+        # BRIN suits the append-only, time-ordered created_at column
+        Index(
+            "ix_ledger_entries_created_at", "created_at",
+            postgresql_using="brin",
+            postgresql_with={"pages_per_range": 32},
+        ),
+        # At most one reversal per entry, enforced by the reversal's insert
+        Index(
+            "uq_one_reversal_per_entry", "related_entry_id",
+            unique=True,
+            postgresql_where=text("entry_type = 'reversal'"),
+        ),
+        # Only rewards still awaiting settlement
+        Index(
+            "idx_reward_open", "reward_id",
+            postgresql_where=text("reward_status IN ('pending', 'confirmed')"),
+        ),
     )
     
     def __repr__(self):
@@ -92,7 +182,7 @@ class UserBalance(Base):
     user_id = Column(String(255), primary_key=True)
     balance_cents = Column(BigInteger, nullable=False, default=0)
     version = Column(Integer, nullable=False, default=1)  # Optimistic locking
-    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = Column(DateTime, nullable=False, server_default=utc_now(), onupdate=utc_now())
     
     __table_args__ = (
         CheckConstraint("balance_cents >= 0", name="non_negative_balance"),
@@ -112,7 +202,7 @@ class ReferralRule(Base):
     """
     __tablename__ = "referral_rules"
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("uuid_generate_v7()"))
     name = Column(String(255), nullable=False)
     description = Column(Text, nullable=True)
     rule_json = Column(JSONB, nullable=False)
@@ -120,6 +210,16 @@ class ReferralRule(Base):
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
     updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # Containment (@>) lookups into rule definitions; jsonb_path_ops is
+        # a fraction of the default jsonb_ops size and only serves @>
+        Index(
+            "idx_rule_json_gin", "rule_json",
+            postgresql_using="gin",
+            postgresql_ops={"rule_json": "jsonb_path_ops"},
+        ),
+    )
+    
     def __repr__(self):
         return f"<ReferralRule {self.name} active={self.is_active}>"
 
@@ -135,8 +235,8 @@ class IdempotencyRecord(Base):
     """
     __tablename__ = "idempotency_records"
     
-    idempotency_key = Column(String(255), primary_key=True)
-    request_hash = Column(String(64), nullable=False)  # Hash of request body
+    idempotency_key = Column(UUID(as_uuid=True), primary_key=True)
+    request_hash = Column(LargeBinary(32), nullable=False)  # Raw digest of the request body
     response_data = Column(JSONB, nullable=True)
     created_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
     
@@ -2,17 +2,24 @@
 API endpoints for rule engine management and evaluation.
 """
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from typing import Dict, Any, List, Optional
 from pydantic import BaseModel, Field
+import msgspec
+import orjson
 import uuid
 
-from database import get_db
-from rule_engine import RuleEngine, EXAMPLE_RULES
-from ai_service import AIService
+from rule_engine import RuleEngine, EXAMPLE_RULES, get_rule_engine
+from ai_service import AIService, get_ai_service
 
 
-router = APIRouter(prefix="/api/v1/rules", tags=["rules"])
+# Default for endpoints without their own response class: orjson instead of
+# the stdlib json encoder
+router = APIRouter(
+    prefix="/api/v1/rules",
+    tags=["rules"],
+    default_response_class=ORJSONResponse
+)
 
 
 # ============================================================================
@@ -65,6 +72,14 @@ class EvaluateEventRequest(BaseModel):
     rule_id: Optional[str] = Field(None, description="Optional: Evaluate against specific rule")
 
 
+class EvaluateBatchRequest(BaseModel):
+    """Request to evaluate several events against the same rules."""
+    events: List[Dict[str, Any]] = Field(
+        ..., min_length=1, max_length=1000, description="Events to evaluate, in order"
+    )
+    rule_id: Optional[str] = Field(None, description="Optional: Evaluate against specific rule")
+
+
 class EvaluationResult(BaseModel):
     """Result of event evaluation."""
     event_data: Dict[str, Any]
@@ -86,6 +101,65 @@ class NaturalLanguageRequest(BaseModel):
     )
 
 
+# ============================================================================
+# RESPONSE ENCODING
+# ============================================================================
+# The Pydantic response models above document the API; responses themselves
+# are msgspec Structs encoded straight to JSON bytes, skipping FastAPI's
+# response validation and jsonable_encoder. (On Pydantic v2 FastAPI no longer
+# clones response_model fields per route, so keeping them for OpenAPI costs
+# no per-route deep copy at import.)
+
+class RuleOut(msgspec.Struct):
+    """
+    Wire form of RuleResponse.
+    
+    Fields are in rule_engine._RULE_COLUMNS order, so a listed rule Row
+    unpacks straight into RuleOut(*row).
+    """
+    id: str
+    name: str
+    description: Optional[str]
+    rule_json: Dict[str, Any]
+    is_active: int
+    created_at: str
+    updated_at: str
+
+
+class EvaluationOut(msgspec.Struct):
+    """Wire form of EvaluationResult."""
+    event_data: Dict[str, Any]
+    rules_evaluated: int
+    rules_triggered: int
+    results: List[Dict[str, Any]]
+
+
+_json_encoder = msgspec.json.Encoder()
+
+
+class MsgspecResponse(Response):
+    """JSON response rendered by msgspec."""
+    media_type = "application/json"
+    
+    def render(self, content: Any) -> bytes:
+        return _json_encoder.encode(content)
+
+
+def _rule_out(rule) -> RuleOut:
+    """Build the response struct for a ReferralRule."""
+    # Always six fractional digits, like the listing query's to_char(..US);
+    # plain isoformat() drops them when microsecond happens to be 0
+    return RuleOut(
+        id=str(rule.id),
+        name=rule.name,
+        description=rule.description,
+        rule_json=rule.rule_json,
+        is_active=rule.is_active,
+        created_at=rule.created_at.isoformat(timespec="microseconds"),
+        updated_at=rule.updated_at.isoformat(timespec="microseconds")
+    )
+
+
 # ============================================================================
 # ENDPOINTS
 # ============================================================================
@@ -93,7 +167,7 @@ class NaturalLanguageRequest(BaseModel):
 @router.post("/", response_model=RuleResponse, status_code=status.HTTP_201_CREATED)
 async def create_rule(
     request: CreateRuleRequest,
-    db: Session = Depends(get_db)
+    engine: RuleEngine = Depends(get_rule_engine)
 ):
     """
     Create a new referral rule.
@@ -103,56 +177,34 @@ async def create_rule(
     - **Actions**: Operations to execute when conditions match
     - **Logic**: How to combine conditions (AND/OR)
     """
-    engine = RuleEngine(db)
-    
-    rule = engine.create_rule(
+    rule = await engine.create_rule(
         name=request.name,
         description=request.description,
-        rule_json=request.rule_json.model_dump()
+        rule_json=request.rule_json.model_dump_json()
     )
     
-    return RuleResponse(
-        id=str(rule.id),
-        name=rule.name,
-        description=rule.description,
-        rule_json=rule.rule_json,
-        is_active=rule.is_active,
-        created_at=rule.created_at.isoformat(),
-        updated_at=rule.updated_at.isoformat()
-    )
+    return MsgspecResponse(_rule_out(rule), status_code=status.HTTP_201_CREATED)
 
 
 @router.get("/", response_model=List[RuleResponse])
 async def get_rules(
     active_only: bool = True,
-    db: Session = Depends(get_db)
+    engine: RuleEngine = Depends(get_rule_engine)
 ):
     """Fetch all rules."""
-    engine = RuleEngine(db)
-    rules = engine.get_rules(active_only=active_only)
+    rules = await engine.get_rules(active_only=active_only)
     
-    return [
-        RuleResponse(
-            id=str(rule.id),
-            name=rule.name,
-            description=rule.description,
-            rule_json=rule.rule_json,
-            is_active=rule.is_active,
-            created_at=rule.created_at.isoformat(),
-            updated_at=rule.updated_at.isoformat()
-        )
-        for rule in rules
-    ]
+    # Ids and timestamps arrive already formatted as strings
+    return MsgspecResponse([RuleOut(*rule) for rule in rules])
 
 
 @router.get("/{rule_id}", response_model=RuleResponse)
 async def get_rule(
     rule_id: str,
-    db: Session = Depends(get_db)
+    engine: RuleEngine = Depends(get_rule_engine)
 ):
     """Fetch a specific rule by ID."""
-    engine = RuleEngine(db)
-    rule = engine.get_rule(rule_id)
+    rule = await engine.get_rule(rule_id)
     
     if not rule:
         raise HTTPException(
@@ -160,21 +212,13 @@ async def get_rule(
             detail=f"Rule {rule_id} not found"
         )
     
-    return RuleResponse(
-        id=str(rule.id),
-        name=rule.name,
-        description=rule.description,
-        rule_json=rule.rule_json,
-        is_active=rule.is_active,
-        created_at=rule.created_at.isoformat(),
-        updated_at=rule.updated_at.isoformat()
-    )
+    return MsgspecResponse(_rule_out(rule))
 
 
 @router.post("/evaluate", response_model=EvaluationResult)
 async def evaluate_event(
     request: EvaluateEventRequest,
-    db: Session = Depends(get_db)
+    engine: RuleEngine = Depends(get_rule_engine)
 ):
     """
     Evaluate an event against rules and trigger actions.
@@ -182,7 +226,8 @@ async def evaluate_event(
     This is the core endpoint that:
     1. Evaluates event data against all active rules (or specific rule)
     2. Executes actions for matching rules (e.g., credit rewards)
-    3. Returns detailed results of evaluation
+    3. Returns detailed results for the rules that triggered (rules that
+       didn't match are only counted in `rules_evaluated`)
     
     **Example Event Data:**
     ```json
@@ -194,43 +239,54 @@ async def evaluate_event(
     }
     ```
     """
-    engine = RuleEngine(db)
-    
-    result = engine.evaluate_event(
+    result = await engine.evaluate_event(
         event_data=request.event_data,
         rule_id=request.rule_id
     )
     
-    return EvaluationResult(**result)
+    return MsgspecResponse(EvaluationOut(**result))
+
+
+@router.post("/evaluate-batch", response_model=List[EvaluationResult])
+async def evaluate_events(
+    request: EvaluateBatchRequest,
+    engine: RuleEngine = Depends(get_rule_engine)
+):
+    """
+    Evaluate several events against rules and trigger actions.
+    
+    Equivalent to calling `/evaluate` once per event, in order, but the
+    rules are loaded and their compiled matchers looked up once for the
+    whole batch. Useful for webhook redelivery and backfills.
+    """
+    results = await engine.evaluate_events(
+        events=request.events,
+        rule_id=request.rule_id
+    )
+    
+    return MsgspecResponse([EvaluationOut(**result) for result in results])
 
 
 @router.post("/seed-examples", status_code=status.HTTP_201_CREATED)
-async def seed_example_rules(db: Session = Depends(get_db)):
+async def seed_example_rules(engine: RuleEngine = Depends(get_rule_engine)):
     """Seed database with example rules for testing."""
-    engine = RuleEngine(db)
-    
-    created_rules = []
-    for example in EXAMPLE_RULES:
-        rule = engine.create_rule(
-            name=example["name"],
-            description=example["description"],
-            rule_json=example["rule_json"]
-        )
-        created_rules.append({
-            "id": str(rule.id),
-            "name": rule.name
-        })
+    # orjson renders the UUIDs itself
+    created_rules = [
+        {"id": rule.id, "name": rule.name}
+        for rule in await engine.create_rules(EXAMPLE_RULES)
+    ]
     
-    return {
+    return ORJSONResponse(status_code=status.HTTP_201_CREATED, content={
         "message": f"Created {len(created_rules)} example rules",
         "rules": created_rules
-    }
+    })
 
 
 @router.post("/nl-to-rule", response_model=RuleResponse, status_code=status.HTTP_201_CREATED)
 async def natural_language_to_rule(
     request: NaturalLanguageRequest,
-    db: Session = Depends(get_db)
+    ai_service: AIService = Depends(get_ai_service),
+    engine: RuleEngine = Depends(get_rule_engine)
 ):
     """
     🤖 **BONUS FEATURE**: Convert natural language to rule JSON using AI.
@@ -273,38 +329,21 @@ async def natural_language_to_rule(
     The generated rule JSON is automatically validated and saved to the database.
     """
     try:
-        # Initialize AI service
-        ai_service = AIService()
-        
         # Convert natural language to rule
-        rule_data = ai_service.natural_language_to_rule(
+        rule_data = await ai_service.natural_language_to_rule(
             description=request.description,
             rule_name=request.rule_name
         )
         
         # Create the rule in database
-        engine = RuleEngine(db)
-        rule = engine.create_rule(
+        rule = await engine.create_rule(
             name=rule_data["name"],
             description=rule_data["description"],
             rule_json=rule_data["rule_json"]
         )
         
-        return RuleResponse(
-            id=str(rule.id),
-            name=rule.name,
-            description=rule.description,
-            rule_json=rule.rule_json,
-            is_active=rule.is_active,
-            created_at=rule.created_at.isoformat(),
-            updated_at=rule.updated_at.isoformat()
-        )
+        return MsgspecResponse(_rule_out(rule), status_code=status.HTTP_201_CREATED)
         
-    except ValueError as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"AI service not configured: {str(e)}. Set GEMINI_API_KEY environment variable."
-        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -312,201 +351,40 @@ async def natural_language_to_rule(
         )
 
 
-
-# ============================================================================
-# SCHEMAS
-# ============================================================================
-
-class RuleCondition(BaseModel):
-    """Schema for a rule condition."""
-    field: str = Field(..., description="Field path to evaluate (e.g., 'user.is_paid')")
-    operator: str = Field(..., description="Comparison operator: ==, !=, >, <, >=, <=, in, contains")
-    value: Any = Field(..., description="Expected value")
-
-
-class RuleAction(BaseModel):
-    """Schema for a rule action."""
-    type: str = Field(..., description="Action type: credit, debit, etc.")
-    user: str = Field("user_id", description="Field name for user ID in event data")
-    amount_cents: int = Field(..., gt=0, description="Amount in cents")
-    reward_id: str = Field(..., description="Reward identifier")
-
-
-class RuleJSON(BaseModel):
-    """Schema for rule definition."""
-    conditions: List[RuleCondition]
-    actions: List[RuleAction]
-    logic: str = Field("AND", description="Logic to combine conditions: AND or OR")
-
-
-class CreateRuleRequest(BaseModel):
-    """Request to create a new rule."""
-    name: str = Field(..., min_length=1, max_length=255)
-    description: Optional[str] = None
-    rule_json: RuleJSON
-
-
-class RuleResponse(BaseModel):
-    """Response schema for a rule."""
-    id: str
-    name: str
-    description: Optional[str]
-    rule_json: Dict[str, Any]
-    is_active: int
-    created_at: str
-    updated_at: str
-
-
-class EvaluateEventRequest(BaseModel):
-    """Request to evaluate an event against rules."""
-    event_data: Dict[str, Any] = Field(..., description="Event data to evaluate")
-    rule_id: Optional[str] = Field(None, description="Optional: Evaluate against specific rule")
-
-
-class EvaluationResult(BaseModel):
-    """Result of event evaluation."""
-    event_data: Dict[str, Any]
-    rules_evaluated: int
-    rules_triggered: int
-    results: List[Dict[str, Any]]
-
-
-# ============================================================================
-# ENDPOINTS
-# ============================================================================
-
-@router.post("/", response_model=RuleResponse, status_code=status.HTTP_201_CREATED)
-async def create_rule(
-    request: CreateRuleRequest,
-    db: Session = Depends(get_db)
-):
-    """
-    Create a new referral rule.
-    
-    Rules consist of:
-    - **Conditions**: Field comparisons that must be met
-    - **Actions**: Operations to execute when conditions match
-    - **Logic**: How to combine conditions (AND/OR)
-    """
-    engine = RuleEngine(db)
-    
-    rule = engine.create_rule(
-        name=request.name,
-        description=request.description,
-        rule_json=request.rule_json.model_dump()
-    )
-    
-    return RuleResponse(
-        id=str(rule.id),
-        name=rule.name,
-        description=rule.description,
-        rule_json=rule.rule_json,
-        is_active=rule.is_active,
-        created_at=rule.created_at.isoformat(),
-        updated_at=rule.updated_at.isoformat()
-    )
-
-
-@router.get("/", response_model=List[RuleResponse])
-async def get_rules(
-    active_only: bool = True,
-    db: Session = Depends(get_db)
-):
-    """Fetch all rules."""
-    engine = RuleEngine(db)
-    rules = engine.get_rules(active_only=active_only)
-    
-    return [
-        RuleResponse(
-            id=str(rule.id),
-            name=rule.name,
-            description=rule.description,
-            rule_json=rule.rule_json,
-            is_active=rule.is_active,
-            created_at=rule.created_at.isoformat(),
-            updated_at=rule.updated_at.isoformat()
-        )
-        for rule in rules
-    ]
-
-
-@router.get("/{rule_id}", response_model=RuleResponse)
-async def get_rule(
-    rule_id: str,
-    db: Session = Depends(get_db)
-):
-    """Fetch a specific rule by ID."""
-    engine = RuleEngine(db)
-    rule = engine.get_rule(rule_id)
-    
-    if not rule:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Rule {rule_id} not found"
-        )
-    
-    return RuleResponse(
-        id=str(rule.id),
-        name=rule.name,
-        description=rule.description,
-        rule_json=rule.rule_json,
-        is_active=rule.is_active,
-        created_at=rule.created_at.isoformat(),
-        updated_at=rule.updated_at.isoformat()
-    )
-
-
-@router.post("/evaluate", response_model=EvaluationResult)
-async def evaluate_event(
-    request: EvaluateEventRequest,
-    db: Session = Depends(get_db)
+@router.post("/nl-to-rule/stream")
+async def natural_language_to_rule_stream(
+    request: NaturalLanguageRequest,
+    ai_service: AIService = Depends(get_ai_service)
 ):
     """
-    Evaluate an event against rules and trigger actions.
+    🤖 **BONUS FEATURE**: Stream a natural language to rule JSON conversion.
     
-    This is the core endpoint that:
-    1. Evaluates event data against all active rules (or specific rule)
-    2. Executes actions for matching rules (e.g., credit rewards)
-    3. Returns detailed results of evaluation
+    Returns newline-delimited JSON events as Gemini generates the rule, so a
+    UI can preview the JSON while it forms. Each `generating` event carries
+    only the text of the new chunk; concatenate the deltas for the full text:
     
-    **Example Event Data:**
-    ```json
-    {
-        "event_id": "evt_123",
-        "referrer_id": "user_456",
-        "referrer": {"is_paid_user": true},
-        "referred": {"subscription_status": "active"}
-    }
     ```
-    """
-    engine = RuleEngine(db)
-    
-    result = engine.evaluate_event(
-        event_data=request.event_data,
-        rule_id=request.rule_id
-    )
+    {"status": "generating", "delta": "{\\n  \\"conditions\\": ["}
+    {"status": "generating", "delta": "\\n    {\\"field\\": \\"referrer.is_paid_user\\", ..."}
+    ...
+    {"status": "complete", "rule": {"name": "...", "description": "...", "rule_json": {...}}}
+    ```
     
-    return EvaluationResult(**result)
-
-
-@router.post("/seed-examples", status_code=status.HTTP_201_CREATED)
-async def seed_example_rules(db: Session = Depends(get_db)):
-    """Seed database with example rules for testing."""
-    engine = RuleEngine(db)
+    If generation fails after streaming has started, the last event is
+    `{"status": "error", "detail": "..."}`.
     
-    created_rules = []
-    for example in EXAMPLE_RULES:
-        rule = engine.create_rule(
-            name=example["name"],
-            description=example["description"],
-            rule_json=example["rule_json"]
-        )
-        created_rules.append({
-            "id": str(rule.id),
-            "name": rule.name
-        })
+    **Note:** The rule is only previewed, not saved. Use `POST /nl-to-rule`
+    or `POST /` to persist it.
+    """
+    async def events():
+        try:
+            async for event in ai_service.natural_language_to_rule_stream(
+                description=request.description,
+                rule_name=request.rule_name
+            ):
+                yield orjson.dumps(event) + b"\n"
+        except HTTPException as e:
+            # Headers are already sent, so report the failure in-band
+            yield orjson.dumps({"status": "error", "detail": e.detail}) + b"\n"
     
-    return {
-        "message": f"Created {len(created_rules)} example rules",
-        "rules": created_rules
-    }
+    return StreamingResponse(events(), media_type="application/x-ndjson")
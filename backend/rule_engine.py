@@ -18,24 +18,200 @@ Example Rules:
 2. "If user makes 5 successful referrals → reward ₹1000 bonus"
 3. "If referred user's first purchase > ₹1000 → reward ₹200"
 """
-from typing import Dict, Any, List, Optional
-from sqlalchemy.orm import Session
+from typing import Callable, Dict, Any, List, Optional, Sequence, Union
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import Row, String, Text, bindparam, cast, func, insert, select
+from sqlalchemy.dialects.postgresql import JSONB
+from fastapi import Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_db
 from models import ReferralRule, EntryType, RewardStatus
 from ledger_service import LedgerService
-from schemas import LedgerCreditRequest
+from schemas import LedgerCreditRequest, MAX_CREDIT_CENTS
+import functools
+import os
+import operator as operator_fn
+import orjson
+import time
 import uuid
 import json
-from datetime import datetime
+
+
+# Rule queries built once at import; executions reuse the same statement
+# objects instead of re-constructing them per request
+_ACTIVE_RULES = select(ReferralRule).where(ReferralRule.is_active == 1)
+
+# Listing rules only reads them back out, so select plain columns: Rows skip
+# ORM instrumentation and identity-map bookkeeping per rule. The id and
+# timestamps are formatted by Postgres, so the driver hands back str and no
+# UUID or datetime objects are built just to be turned into JSON strings.
+_ISO_TIMESTAMP = 'YYYY-MM-DD"T"HH24:MI:SS.US'
+_RULE_COLUMNS = (
+    cast(ReferralRule.id, String).label("id"),
+    ReferralRule.name,
+    ReferralRule.description,
+    ReferralRule.rule_json,
+    ReferralRule.is_active,
+    func.to_char(ReferralRule.created_at, _ISO_TIMESTAMP).label("created_at"),
+    func.to_char(ReferralRule.updated_at, _ISO_TIMESTAMP).label("updated_at"),
+)
+_ALL_RULE_ROWS = select(*_RULE_COLUMNS)
+_ACTIVE_RULE_ROWS = select(*_RULE_COLUMNS).where(ReferralRule.is_active == 1)
+
+
+def _uuid7() -> uuid.UUID:
+    """Time-ordered UUIDv7, laid out like the uuid_generate_v7() server default."""
+    value = bytearray(os.urandom(16))
+    value[:6] = (time.time_ns() // 1_000_000).to_bytes(6, "big")
+    value[6] = (value[6] & 0x0F) | 0x70  # version 7
+    value[8] = (value[8] & 0x3F) | 0x80  # RFC 9562 variant
+    return uuid.UUID(bytes=bytes(value))
+
+
+# ============================================================================
+# RULE COMPILATION
+# ============================================================================
+# Each rule's conditions are turned into one Python function, so evaluating
+# an event runs straight-line bytecode instead of re-interpreting the
+# condition dicts. Field names and expected values are bound as names in the
+# function's namespace - only generated identifiers and the fixed operator
+# templates below ever reach the source text.
+
+# {a} is the event value expression, {e} the expected value's name
+_OPERATOR_TEMPLATES = {
+    "==": "{a} == {e}",
+    "!=": "{a} != {e}",
+    ">": "{a} > {e}",
+    "<": "{a} < {e}",
+    ">=": "{a} >= {e}",
+    "<=": "{a} <= {e}",
+    "in": "{a} in {e}",
+    "not_in": "{a} not in {e}",
+    "contains": "{e} in {a}",
+}
+
+# Compiled matchers by (rule id, updated_at); a changed rule gets a new key
+_COMPILED_RULES: LRUCache = LRUCache(maxsize=1024)
+
+
+def _compile_conditions(conditions: List[Dict], logic: str = "AND") -> Callable[[Dict], bool]:
+    """
+    Compile a rule's conditions into a function of the event data.
+    
+    Matches RuleEngine._evaluate_conditions: a nested field path stops
+    matching at the first non-dict value, unknown operators never match,
+    an empty condition list always matches and any logic other than "OR"
+    means AND. Clauses short-circuit in order, as in the interpreter.
+    
+    Args:
+        conditions: Condition dicts from rule_json
+        logic: "AND" or "OR"
+    
+    Returns:
+        Function taking event_data and returning whether the rule matches
+    """
+    namespace: Dict[str, Any] = {}
+    clauses = []
+    
+    for i, condition in enumerate(conditions):
+        template = _OPERATOR_TEMPLATES.get(condition.get("operator", "=="))
+        if template is None:
+            clauses.append("False")
+            continue
+        
+        # event_data.get(k0) ... .get(kn), checking each step is a dict
+        keys = condition.get("field", "").split(".")
+        steps = ["isinstance(event_data, dict)"]
+        source = "event_data"
+        for j, key in enumerate(keys):
+            key_name = f"_k{i}_{j}"
+            namespace[key_name] = key
+            lookup = f"(_t := {source}.get({key_name}))"
+            if j < len(keys) - 1:
+                steps.append(f"isinstance({lookup}, dict)")
+            source = "_t"
+        
+        value_name = f"_v{i}"
+        namespace[value_name] = condition.get("value")
+        steps.append(template.format(a=lookup, e=value_name))
+        clauses.append("(" + " and ".join(steps) + ")")
+    
+    joiner = " or " if logic == "OR" else " and "
+    body = joiner.join(clauses) or "True"
+    source_text = f"def _matches(event_data):\n    return {body}\n"
+    exec(compile(source_text, "<compiled rule>", "exec"), namespace)
+    return namespace["_matches"]
+
+
+# Interpreter counterparts of _OPERATOR_TEMPLATES, as (actual, expected)
+# functions; the C-level operator functions where the argument order allows
+_OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator_fn.eq,
+    "!=": operator_fn.ne,
+    ">": operator_fn.gt,
+    "<": operator_fn.lt,
+    ">=": operator_fn.ge,
+    "<=": operator_fn.le,
+    "in": lambda actual, expected: actual in expected,
+    "not_in": lambda actual, expected: actual not in expected,
+    "contains": operator_fn.contains,  # expected in actual
+}
+
+# Returned by a field lookup that hits a non-dict before the end of the path
+_MISSING = object()
+
+
+@functools.lru_cache(maxsize=4096)
+def _make_lookup(field_path: str) -> Callable[[Any], Any]:
+    """
+    Build a getter for a dotted field path, for the interpreted fallback.
+    
+    Memoized per path, so the path is split once per process rather than
+    on every condition evaluation.
+    
+    Args:
+        field_path: Path like "referrer.is_paid_user"
+    
+    Returns:
+        Function returning the value at the path in event data (None for a
+        missing key), or _MISSING if a step along the way isn't a dict
+    """
+    keys = tuple(field_path.split("."))
+    
+    def lookup(data: Any) -> Any:
+        for key in keys:
+            if not isinstance(data, dict):
+                return _MISSING
+            data = data.get(key)
+        return data
+    
+    return lookup
 
 
 class RuleEngine:
     """Evaluates events against defined rules and triggers actions."""
     
-    def __init__(self, db: Session):
+    # The _load_rules snapshot of all active rules, shared across requests in
+    # the process. Rule writes here clear it; the short TTL bounds how long
+    # rules created or edited through other workers go unseen.
+    active_rules: TTLCache = TTLCache(maxsize=1, ttl=5)
+    # Bumped on every clear. _load_rules only caches what it read if the
+    # generation is unchanged since its query started, so a load that
+    # overlapped a rule write can't re-cache the rule set from before it.
+    active_rules_generation: int = 0
+    
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.ledger_service = LedgerService(db)
     
-    def _evaluate_condition(self, condition: Dict, event_data: Dict) -> bool:
+    @classmethod
+    def _invalidate_active_rules(cls) -> None:
+        """Drop the cached active rule set after a committed rule write."""
+        cls.active_rules.clear()
+        cls.active_rules_generation += 1
+    
+    @staticmethod
+    def _evaluate_condition(condition: Dict, event_data: Dict) -> bool:
         """
         Evaluate a single condition against event data.
         
@@ -51,37 +227,44 @@ class RuleEngine:
         expected_value = condition.get("value")
         
         # Extract value from nested field path (e.g., "user.is_paid")
-        actual_value = event_data
-        for key in field_path.split("."):
-            if isinstance(actual_value, dict):
-                actual_value = actual_value.get(key)
-            else:
-                return False
+        actual_value = _make_lookup(field_path)(event_data)
+        if actual_value is _MISSING:
+            return False
         
         # Evaluate operator
-        if operator == "==":
-            return actual_value == expected_value
-        elif operator == "!=":
-            return actual_value != expected_value
-        elif operator == ">":
-            return actual_value > expected_value
-        elif operator == "<":
-            return actual_value < expected_value
-        elif operator == ">=":
-            return actual_value >= expected_value
-        elif operator == "<=":
-            return actual_value <= expected_value
-        elif operator == "in":
-            return actual_value in expected_value
-        elif operator == "not_in":
-            return actual_value not in expected_value
-        elif operator == "contains":
-            return expected_value in actual_value
-        else:
+        compare = _OPERATORS.get(operator)
+        if compare is None:
             return False
+        return compare(actual_value, expected_value)
     
+    def _rule_matcher(
+        self,
+        rule_id: uuid.UUID,
+        updated_at: Any,
+        rule_json: Dict[str, Any]
+    ) -> Callable[[Dict], bool]:
+        """
+        Get the compiled matcher for a rule, compiling it on first use.
+        
+        Rules whose conditions can't be compiled (malformed JSON from older
+        rows) fall back to the interpreter for that rule.
+        """
+        key = (rule_id, updated_at)
+        matcher = _COMPILED_RULES.get(key)
+        if matcher is None:
+            conditions = rule_json.get("conditions", [])
+            logic = rule_json.get("logic", "AND")
+            try:
+                matcher = _compile_conditions(conditions, logic)
+            except Exception:
+                matcher = functools.partial(
+                    RuleEngine._evaluate_conditions, conditions, logic=logic
+                )
+            _COMPILED_RULES[key] = matcher
+        return matcher
+    
+    @staticmethod
     def _evaluate_conditions(
-        self, 
         conditions: List[Dict], 
         event_data: Dict,
         logic: str = "AND"
@@ -100,16 +283,14 @@ class RuleEngine:
         if not conditions:
             return True
         
-        results = [self._evaluate_condition(c, event_data) for c in conditions]
+        # Lazily evaluated, so all()/any() stop at the first deciding condition
+        results = (RuleEngine._evaluate_condition(c, event_data) for c in conditions)
         
-        if logic == "AND":
-            return all(results)
-        elif logic == "OR":
+        if logic == "OR":
             return any(results)
-        else:
-            return all(results)  # Default to AND
+        return all(results)  # AND, and the default for anything else
     
-    def _execute_action(self, action: Dict, event_data: Dict) -> Dict[str, Any]:
+    async def _execute_action(self, action: Dict, event_data: Dict) -> Dict[str, Any]:
         """
         Execute a single action.
         
@@ -135,9 +316,27 @@ class RuleEngine:
             
             # Create credit request
             amount_cents = action.get("amount_cents", 0)
-            reward_id = action.get("reward_id", str(uuid.uuid4()))
+            # Only draw a random reward id when the action doesn't name one
+            reward_id = action["reward_id"] if "reward_id" in action else os.urandom(16).hex()
             
-            credit_request = LedgerCreditRequest(
+            # Stored rule JSON isn't guaranteed to have been validated (older
+            # rows, AI-generated rules), so check the amount here; the column
+            # widths cover user_id and reward_id. The request is then built
+            # without running its validators, so coerce here what they would
+            # have: integral floats (5000.0) become ints, bools are rejected.
+            if isinstance(amount_cents, float) and amount_cents.is_integer():
+                amount_cents = int(amount_cents)
+            if (
+                isinstance(amount_cents, bool)
+                or not isinstance(amount_cents, int)
+                or not 0 < amount_cents <= MAX_CREDIT_CENTS
+            ):
+                return {
+                    "success": False,
+                    "error": f"Invalid amount_cents in action: {amount_cents!r}"
+                }
+            
+            credit_request = LedgerCreditRequest.model_construct(
                 user_id=str(user_id),
                 amount_cents=amount_cents,
                 reward_id=reward_id,
@@ -145,17 +344,16 @@ class RuleEngine:
                 extra_data={
                     "source": "rule_engine",
                     "action": action,
-                    "event_data": event_data,
-                    "timestamp": datetime.utcnow().isoformat()
+                    "event_data": event_data
                 }
             )
             
             # Generate idempotency key from event + rule + user
             idempotency_data = f"{reward_id}:{user_id}:{event_data.get('event_id', '')}"
-            idempotency_key = str(uuid.uuid5(uuid.NAMESPACE_DNS, idempotency_data))
+            idempotency_key = uuid.uuid5(uuid.NAMESPACE_DNS, idempotency_data)
             
             try:
-                entry, is_duplicate = self.ledger_service.credit(
+                entry, is_duplicate = await self.ledger_service.credit(
                     credit_request, 
                     idempotency_key
                 )
@@ -185,101 +383,229 @@ class RuleEngine:
                 "error": f"Unknown action type: {action_type}"
             }
     
-    def evaluate_event(self, event_data: Dict[str, Any], rule_id: Optional[str] = None) -> Dict[str, Any]:
+    async def _load_rules(self, rule_id: Optional[str] = None) -> List[tuple]:
         """
-        Evaluate an event against rules and execute matching actions.
-        
-        Args:
-            event_data: Event data to evaluate
-            rule_id: Optional specific rule ID to evaluate, otherwise all active rules
+        Load the active rules (or one rule) with their compiled matchers.
         
         Returns:
-            Dictionary with evaluation results
+            (rule_id, name, rule_json, matcher) tuples
         """
-        # Fetch rules
-        query = self.db.query(ReferralRule).filter(ReferralRule.is_active == 1)
+        query = _ACTIVE_RULES
         
         if rule_id:
-            query = query.filter(ReferralRule.id == rule_id)
+            query = query.where(ReferralRule.id == rule_id)
+        else:
+            cached = RuleEngine.active_rules.get("active")
+            if cached is not None:
+                return cached
+            generation = RuleEngine.active_rules_generation
         
-        rules = query.all()
+        # Snapshot rule fields up front: a failed credit rolls the session back,
+        # which expires loaded rules and async sessions cannot lazily reload them
+        rules = [
+            (
+                str(rule.id),
+                rule.name,
+                rule.rule_json,
+                self._rule_matcher(rule.id, rule.updated_at, rule.rule_json)
+            )
+            for rule in (await self.db.scalars(query)).all()
+        ]
+        
+        if not rule_id and RuleEngine.active_rules_generation == generation:
+            RuleEngine.active_rules["active"] = rules
+        return rules
+    
+    async def _evaluate_loaded(self, rules: List[tuple], event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Evaluate one event against rules from _load_rules and execute matching actions.
         
+        Returns:
+            Evaluation summary; results lists only the rules that triggered,
+            while rules_evaluated counts every rule checked
+        """
         results = []
         
-        for rule in rules:
-            rule_json = rule.rule_json
-            
+        for matched_rule_id, rule_name, rule_json, matches in rules:
             # Evaluate conditions
-            conditions = rule_json.get("conditions", [])
-            logic = rule_json.get("logic", "AND")
+            if not matches(event_data):
+                continue
             
-            conditions_met = self._evaluate_conditions(conditions, event_data, logic)
+            # Execute actions
+            actions = rule_json.get("actions", [])
+            action_results = []
             
-            if conditions_met:
-                # Execute actions
-                actions = rule_json.get("actions", [])
-                action_results = []
-                
-                for action in actions:
-                    result = self._execute_action(action, event_data)
-                    action_results.append(result)
-                
-                results.append({
-                    "rule_id": str(rule.id),
-                    "rule_name": rule.name,
-                    "conditions_met": True,
-                    "actions_executed": action_results
-                })
-            else:
-                results.append({
-                    "rule_id": str(rule.id),
-                    "rule_name": rule.name,
-                    "conditions_met": False,
-                    "actions_executed": []
-                })
+            for action in actions:
+                result = await self._execute_action(action, event_data)
+                action_results.append(result)
+            
+            results.append({
+                "rule_id": matched_rule_id,
+                "rule_name": rule_name,
+                "conditions_met": True,
+                "actions_executed": action_results
+            })
         
         return {
             "event_data": event_data,
-            "rules_evaluated": len(results),
-            "rules_triggered": sum(1 for r in results if r["conditions_met"]),
+            "rules_evaluated": len(rules),
+            "rules_triggered": len(results),
             "results": results
         }
     
-    def create_rule(
+    async def evaluate_event(self, event_data: Dict[str, Any], rule_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Evaluate an event against rules and execute matching actions.
+        
+        Args:
+            event_data: Event data to evaluate
+            rule_id: Optional specific rule ID to evaluate, otherwise all active rules
+        
+        Returns:
+            Dictionary with evaluation results
+        """
+        rules = await self._load_rules(rule_id)
+        return await self._evaluate_loaded(rules, event_data)
+    
+    async def evaluate_events(
+        self,
+        events: List[Dict[str, Any]],
+        rule_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Evaluate several events, loading and compiling the rules only once.
+        
+        Args:
+            events: Event data dicts, evaluated in order
+            rule_id: Optional specific rule ID to evaluate, otherwise all active rules
+        
+        Returns:
+            One evaluate_event-style result per event, in the same order
+        """
+        rules = await self._load_rules(rule_id)
+        return [await self._evaluate_loaded(rules, event_data) for event_data in events]
+    
+    async def create_rule(
         self, 
         name: str, 
-        rule_json: Dict[str, Any],
+        rule_json: Union[Dict[str, Any], str],
         description: Optional[str] = None
     ) -> ReferralRule:
-        """Create a new referral rule."""
-        rule = ReferralRule(
-            id=uuid.uuid4(),
-            name=name,
-            description=description,
-            rule_json=rule_json,
-            is_active=1,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+        """
+        Create a new referral rule.
+        
+        Args:
+            name: Rule name
+            rule_json: Rule definition, as a dict or as already-serialized
+                JSON text (e.g. from model_dump_json), which is cast to JSONB
+                in the INSERT without another serialization pass
+            description: Optional description
+        
+        Returns:
+            The stored rule, loaded from the INSERT's RETURNING
+        """
+        if not isinstance(rule_json, str):
+            rule_json = orjson.dumps(rule_json).decode()
+        
+        stmt = (
+            insert(ReferralRule)
+            .values(
+                name=name,
+                description=description,
+                rule_json=cast(bindparam("rule_json_text", rule_json, type_=Text), JSONB),
+                is_active=1
+            )
+            .returning(ReferralRule)
         )
+        rule = await self.db.scalar(stmt)
+        await self.db.commit()
+        self._invalidate_active_rules()
         
-        self.db.add(rule)
-        self.db.commit()
-        self.db.refresh(rule)
+        # Compile now so the first evaluation doesn't pay for it
+        self._rule_matcher(rule.id, rule.updated_at, rule.rule_json)
         
         return rule
     
-    def get_rules(self, active_only: bool = True) -> List[ReferralRule]:
-        """Fetch all rules."""
-        query = self.db.query(ReferralRule)
+    async def create_rules(self, rules: List[Dict[str, Any]]) -> Sequence[Row]:
+        """
+        Create several referral rules with one multi-row INSERT.
+        
+        Ids are generated here rather than by the server default, so the
+        RETURNING rows can be put back in input order by id. Asking
+        SQLAlchemy for that order instead (sort_by_parameter_order) needs a
+        sentinel column; a server-default UUID key isn't one, and it falls
+        back to one INSERT per rule.
         
-        if active_only:
-            query = query.filter(ReferralRule.is_active == 1)
+        Args:
+            rules: Rule dicts with name, rule_json and optional description
+        
+        Returns:
+            (id, name, updated_at) Rows, in the same order as rules
+        """
+        stmt = insert(ReferralRule).returning(
+            ReferralRule.id,
+            ReferralRule.name,
+            ReferralRule.updated_at
+        )
+        params = [
+            {
+                "id": _uuid7(),
+                "name": rule["name"],
+                "description": rule.get("description"),
+                "rule_json": rule["rule_json"],
+                "is_active": 1
+            }
+            for rule in rules
+        ]
+        rows_by_id = {
+            row.id: row for row in await self.db.execute(stmt, params)
+        }
+        created = [rows_by_id[param["id"]] for param in params]
+        await self.db.commit()
+        self._invalidate_active_rules()
         
-        return query.all()
+        for rule, row in zip(rules, created):
+            self._rule_matcher(row.id, row.updated_at, rule["rule_json"])
+        
+        return created
+    
+    async def get_rules(self, active_only: bool = True) -> Sequence[Row]:
+        """
+        Fetch all rules.
+        
+        Returns:
+            Rows in _RULE_COLUMNS order, with the id and timestamps as
+            ISO-formatted strings rather than UUID/datetime
+        """
+        query = _ACTIVE_RULE_ROWS if active_only else _ALL_RULE_ROWS
+        return (await self.db.execute(query)).all()
+    
+    async def get_rule(self, rule_id: str) -> Optional[ReferralRule]:
+        """
+        Fetch a specific rule by ID.
+        
+        Primary key lookup via Session.get: served from the identity map
+        when the rule is already loaded in this session.
+        
+        Returns:
+            The rule, or None if it doesn't exist or rule_id isn't a UUID
+        """
+        try:
+            key = uuid.UUID(rule_id)
+        except ValueError:
+            return None
+        return await self.db.get(ReferralRule, key)
+
+
+def get_rule_engine(db: AsyncSession = Depends(get_db)) -> RuleEngine:
+    """
+    FastAPI dependency providing a RuleEngine bound to the request's session.
     
-    def get_rule(self, rule_id: str) -> Optional[ReferralRule]:
-        """Fetch a specific rule by ID."""
-        return self.db.query(ReferralRule).filter(ReferralRule.id == rule_id).first()
+    The engine itself is a thin per-request wrapper; anything worth
+    building once (compiled rules, cached lookups) lives at class or module
+    level, so requests never share a session through a shared engine.
+    """
+    return RuleEngine(db)
 
 
 # Example rules for testing
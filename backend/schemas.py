@@ -1,26 +1,22 @@
 """Pydantic schemas for API request/response validation."""
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from models import EntryType, RewardStatus
 import uuid
 
 
+# Largest single credit accepted (10 million dollars)
+MAX_CREDIT_CENTS = 1_000_000_000
+
+
 class LedgerCreditRequest(BaseModel):
     """Request schema for crediting a user's account."""
     user_id: str = Field(..., min_length=1, max_length=255, description="User identifier")
-    amount_cents: int = Field(..., gt=0, description="Amount to credit in cents")
+    amount_cents: int = Field(..., gt=0, le=MAX_CREDIT_CENTS, description="Amount to credit in cents")
     reward_id: Optional[str] = Field(None, max_length=255, description="Associated reward ID")
     reward_status: Optional[RewardStatus] = Field(RewardStatus.PENDING, description="Reward lifecycle status")
     extra_data: Dict[str, Any] = Field(default_factory=dict, description="Additional context for audit trail")
-    
-    @validator('amount_cents')
-    def validate_amount(cls, v):
-        if v <= 0:
-            raise ValueError("Amount must be positive")
-        if v > 1_000_000_000:  # 10 million dollars max
-            raise ValueError("Amount exceeds maximum allowed")
-        return v
 
 
 class LedgerDebitRequest(BaseModel):
@@ -28,12 +24,6 @@ class LedgerDebitRequest(BaseModel):
     user_id: str = Field(..., min_length=1, max_length=255, description="User identifier")
     amount_cents: int = Field(..., gt=0, description="Amount to debit in cents")
     extra_data: Dict[str, Any] = Field(default_factory=dict, description="Additional context for audit trail")
-    
-    @validator('amount_cents')
-    def validate_amount(cls, v):
-        if v <= 0:
-            raise ValueError("Amount must be positive")
-        return v
 
 
 class LedgerReversalRequest(BaseModel):
@@ -43,56 +33,40 @@ class LedgerReversalRequest(BaseModel):
     extra_data: Dict[str, Any] = Field(default_factory=dict, description="Additional context for audit trail")
 
 
+class LedgerBatchCreditRequest(BaseModel):
+    """Request schema for crediting many accounts in one transaction."""
+    items: List[LedgerCreditRequest] = Field(
+        ..., min_length=1, max_length=1000, description="Credits to apply together"
+    )
+
+
 class LedgerEntryResponse(BaseModel):
-    """Response schema for a single ledger entry."""
-    id: str  # UUID serialized as string for JSON
+    """
+    Response schema for a single ledger entry.
+    
+    Validated straight from the ORM object by pydantic-core; UUIDs stay
+    UUIDs until orjson renders them as strings in the response body.
+    """
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: uuid.UUID
     user_id: str
     entry_type: EntryType
     amount_cents: int
     reward_id: Optional[str]
     reward_status: Optional[RewardStatus]
-    idempotency_key: str
-    related_entry_id: Optional[str]  # UUID serialized as string
+    idempotency_key: uuid.UUID
+    related_entry_id: Optional[uuid.UUID]
+    operation: str
+    reason: Optional[str] = None
     extra_data: Dict[str, Any]
     created_at: datetime
-    
-    class Config:
-        from_attributes = True
-        json_encoders = {
-            datetime: lambda v: v.isoformat(),
-            uuid.UUID: str,  # Automatically convert UUID objects to strings
-        }
-    
-    @classmethod
-    def from_orm(cls, obj):
-        """Convert ORM object to response, ensuring UUIDs are strings."""
-        # Helper function to recursively convert UUIDs to strings in nested dicts
-        def _serialize_value(value):
-            if isinstance(value, uuid.UUID):
-                return str(value)
-            elif isinstance(value, dict):
-                return {k: _serialize_value(v) for k, v in value.items()}
-            elif isinstance(value, list):
-                return [_serialize_value(item) for item in value]
-            else:
-                return value
-        
-        return cls(
-            id=str(obj.id),
-            user_id=obj.user_id,
-            entry_type=obj.entry_type,
-            amount_cents=obj.amount_cents,
-            reward_id=obj.reward_id,
-            reward_status=obj.reward_status,
-            idempotency_key=obj.idempotency_key,
-            related_entry_id=str(obj.related_entry_id) if obj.related_entry_id else None,
-            extra_data=_serialize_value(obj.extra_data),  # Recursively clean UUIDs
-            created_at=obj.created_at
-        )
 
 
 class UserBalanceResponse(BaseModel):
     """Response schema for user balance."""
+    model_config = ConfigDict(from_attributes=True)
+    
     user_id: str
     balance_cents: int
     balance_dollars: float
@@ -109,9 +83,6 @@ class UserBalanceResponse(BaseModel):
             version=user_balance.version,
             updated_at=user_balance.updated_at
         )
-    
-    class Config:
-        from_attributes = True
 
 
 class LedgerEntriesResponse(BaseModel):
@@ -131,6 +102,15 @@ class IdempotentResponse(BaseModel):
     )
 
 
+class IdempotentBatchResponse(BaseModel):
+    """Response wrapper for a batch operation, in request item order."""
+    data: List[LedgerEntryResponse]
+    is_duplicate: bool = Field(
+        False,
+        description="True if this batch was a duplicate and returned cached response"
+    )
+
+
 class ErrorResponse(BaseModel):
     """Standard error response."""
     error: str
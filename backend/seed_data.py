@@ -3,9 +3,12 @@ Seed script to populate database with example data.
 
 Run with: python seed_data.py
 """
+import hashlib
 import sys
 import uuid
-from sqlalchemy import create_engine
+
+import orjson
+from sqlalchemy import create_engine, insert
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
@@ -27,6 +30,10 @@ def seed_database():
     try:
         print("🌱 Seeding database...")
         
+        # Each table is written with one executemany INSERT (sent as
+        # multi-row VALUES) instead of an ORM flush per object
+        now = datetime.utcnow()
+        
         # 1. Create some users with balances
         users = [
             {"user_id": "alice", "balance_cents": 50000},  # $500
@@ -34,14 +41,11 @@ def seed_database():
             {"user_id": "charlie", "balance_cents": 0},
         ]
         
+        session.execute(insert(UserBalance), [
+            {**user_data, "version": 1, "updated_at": now}
+            for user_data in users
+        ])
         for user_data in users:
-            balance = UserBalance(
-                user_id=user_data["user_id"],
-                balance_cents=user_data["balance_cents"],
-                version=1,
-                updated_at=datetime.utcnow()
-            )
-            session.add(balance)
             print(f"  ✓ Created balance for {user_data['user_id']}: ${user_data['balance_cents']/100:.2f}")
         
         # 2. Create some ledger entries
@@ -64,33 +68,34 @@ def seed_database():
             }
         ]
         
+        session.execute(insert(LedgerEntry), [
+            {
+                **entry_data,
+                "idempotency_key": uuid.uuid4(),
+                "request_hash": hashlib.sha256(
+                    orjson.dumps(entry_data, option=orjson.OPT_SORT_KEYS)
+                ).digest(),
+                "operation": "credit",
+                "created_at": now
+            }
+            for entry_data in ledger_entries
+        ])
         for entry_data in ledger_entries:
-            entry = LedgerEntry(
-                id=uuid.uuid4(),
-                user_id=entry_data["user_id"],
-                entry_type=entry_data["entry_type"],
-                amount_cents=entry_data["amount_cents"],
-                reward_id=entry_data.get("reward_id"),
-                reward_status=entry_data.get("reward_status"),
-                idempotency_key=f"seed_{uuid.uuid4()}",
-                extra_data=entry_data.get("extra_data", {}),
-                created_at=datetime.utcnow()
-            )
-            session.add(entry)
             print(f"  ✓ Created {entry_data['entry_type'].value} for {entry_data['user_id']}: ${entry_data['amount_cents']/100:.2f}")
         
         # 3. Create example referral rules
+        session.execute(insert(ReferralRule), [
+            {
+                "name": rule_data["name"],
+                "description": rule_data["description"],
+                "rule_json": rule_data["rule_json"],
+                "is_active": 1,
+                "created_at": now,
+                "updated_at": now
+            }
+            for rule_data in EXAMPLE_RULES
+        ])
         for rule_data in EXAMPLE_RULES:
-            rule = ReferralRule(
-                id=uuid.uuid4(),
-                name=rule_data["name"],
-                description=rule_data["description"],
-                rule_json=rule_data["rule_json"],
-                is_active=1,
-                created_at=datetime.utcnow(),
-                updated_at=datetime.utcnow()
-            )
-            session.add(rule)
             print(f"  ✓ Created rule: {rule_data['name']}")
         
         # Commit all changes
@@ -0,0 +1,191 @@
+"""
+Tests for the AI service's local helpers.
+
+Tests cover:
+1. Semantic Cache: Near-duplicate descriptions only reuse rules with the same numbers
+2. JSON Extraction: Rule JSON is found in fenced or prose-wrapped responses
+3. Streaming Scanner: Objects split across chunks are found exactly once
+
+None of these tests call Gemini.
+"""
+import numpy as np
+import orjson
+import pytest
+
+from ai_service import (
+    AIService, EMBEDDING_DIM, _FENCE_RE, _JsonObjectScanner, _find_json_object,
+    _numeric_tokens
+)
+
+
+@pytest.fixture
+def ai_service():
+    """An AI service whose caches start empty; no API calls are made."""
+    return AIService(api_key="test-key")
+
+
+# Braces and escaped quotes inside strings, around a nested object
+SCANNER_TEXT = 'Sure: {"name": "say \\"}\\" {x}", "extra": {"path": "C:\\\\"}} bye'
+SCANNER_OBJECT = SCANNER_TEXT[len("Sure: "):-len(" bye")]
+
+
+def _unit_vector(index):
+    """A normalized embedding pointing along one axis."""
+    embedding = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    embedding[index] = 1.0
+    return embedding
+
+
+class TestSemanticCache:
+    """Test the numeric guard on semantic cache hits."""
+    
+    def test_numeric_tokens_keep_order_and_spelling(self):
+        """Digits and number words are extracted in order, as written."""
+        assert _numeric_tokens("Reward $50 when a user refers Three friends") == ("50", "three")
+        assert _numeric_tokens("Pay $1,000.50 after 2 purchases") == ("1,000.50", "2")
+        assert _numeric_tokens("Reward paid users") == ()
+    
+    def test_similar_description_with_same_numbers_hits(self, ai_service):
+        """An identical embedding with the same numbers reuses the cached rule."""
+        rule_json = {"conditions": [], "actions": [], "logic": "AND"}
+        ai_service._semantic_store(_unit_vector(0), ("50", "3"), rule_json)
+        
+        assert ai_service._semantic_lookup(_unit_vector(0), ("50", "3")) is rule_json
+    
+    @pytest.mark.parametrize("numbers", [("500", "3"), ("50",), ("3", "50"), ()])
+    def test_similar_description_with_other_numbers_misses(self, ai_service, numbers):
+        """Near-identical embeddings for "$50" and "$500" must not share a rule."""
+        ai_service._semantic_store(_unit_vector(0), ("50", "3"), {"logic": "AND"})
+        
+        assert ai_service._semantic_lookup(_unit_vector(0), numbers) is None
+    
+    def test_dissimilar_description_misses(self, ai_service):
+        """Matching numbers alone are not enough without a similar embedding."""
+        ai_service._semantic_store(_unit_vector(0), ("50",), {"logic": "AND"})
+        
+        assert ai_service._semantic_lookup(_unit_vector(1), ("50",)) is None
+    
+    def test_empty_cache_misses(self, ai_service):
+        """Nothing is returned before any rule has been stored."""
+        assert ai_service._semantic_lookup(_unit_vector(0), ()) is None
+
+
+class TestJsonExtraction:
+    """Test pulling the rule object out of a Gemini response."""
+    
+    def test_object_found_in_surrounding_prose(self):
+        """Text before and after the object is skipped."""
+        assert _find_json_object('Here you go: {"a": 1} Hope that helps!') == '{"a": 1}'
+    
+    def test_nested_object_returned_whole(self):
+        """Depth counting returns the outermost object, not the first inner one."""
+        text = 'Rule: {"a": {"b": {"c": 1}}, "d": 2} done'
+        
+        assert _find_json_object(text) == '{"a": {"b": {"c": 1}}, "d": 2}'
+    
+    def test_braces_inside_strings_ignored(self):
+        """Braces inside string values don't change the depth."""
+        text = '{"reward_id": "}{", "extra": {"note": "{"}} trailing }'
+        
+        assert _find_json_object(text) == '{"reward_id": "}{", "extra": {"note": "{"}}'
+    
+    def test_escaped_quotes_inside_strings(self):
+        """An escaped quote doesn't end the string it appears in."""
+        text = r'{"name": "say \"}\" twice", "n": 1} and {"other": 2}'
+        
+        assert _find_json_object(text) == r'{"name": "say \"}\" twice", "n": 1}'
+    
+    def test_escaped_backslash_before_closing_quote(self):
+        """A string ending in an escaped backslash still closes at its quote."""
+        text = r'{"path": "C:\\"} then {"x": 1}'
+        
+        assert _find_json_object(text) == r'{"path": "C:\\"}'
+    
+    @pytest.mark.parametrize("text", ["no json here", '{"a": {"b": 1}', '{"a": "}'])
+    def test_unbalanced_object_returns_none(self, text):
+        """Without a closing brace outside strings there is no object."""
+        assert _find_json_object(text) is None
+    
+    def test_extract_strips_markdown_fence(self, ai_service):
+        """A ```json fenced response parses to the object inside."""
+        response_text = '```json\n{"logic": "AND", "conditions": []}\n```'
+        
+        assert ai_service._extract_json_from_response(response_text) == {
+            "logic": "AND", "conditions": []
+        }
+    
+    @pytest.mark.parametrize("response_text", [
+        '```json\n{"a": 1}\n```',
+        '```\n{"a": 1}\n```',
+        '```json{"a": 1}```',
+        '{"a": 1}',
+    ])
+    def test_fence_regex_strips_response_boundaries(self, response_text):
+        """Leading ``` or ```json and trailing ``` are removed."""
+        assert _FENCE_RE.sub("", response_text) == '{"a": 1}'
+    
+    def test_fence_regex_leaves_inner_fences_alone(self):
+        """Fences that don't start or end the whole response are kept."""
+        text = 'first\n```\nsecond\n```json\nthird'
+        
+        assert _FENCE_RE.sub("", text) == text
+    
+    def test_extract_keeps_backticks_inside_strings(self, ai_service):
+        """Backticks inside a JSON string value survive fence stripping."""
+        response_text = '```json\n{"description": "wrap ```code``` like this"}\n```'
+        
+        assert ai_service._extract_json_from_response(response_text) == {
+            "description": "wrap ```code``` like this"
+        }
+    
+    def test_extract_falls_back_to_object_in_prose(self, ai_service):
+        """A response with prose around the JSON still parses."""
+        response_text = 'Sure! Here is the rule:\n{"logic": "OR"}\nLet me know.'
+        
+        assert ai_service._extract_json_from_response(response_text) == {"logic": "OR"}
+    
+    def test_extract_without_json_raises(self, ai_service):
+        """A response with no parseable object is a ValueError."""
+        with pytest.raises(ValueError):
+            ai_service._extract_json_from_response("I can't convert that rule.")
+
+
+class TestStreamingScanner:
+    """Test _JsonObjectScanner fed a response in chunks."""
+    
+    def test_sample_object_parses(self):
+        """The sample object used below is valid JSON on its own."""
+        assert _find_json_object(SCANNER_TEXT) == SCANNER_OBJECT
+        assert orjson.loads(SCANNER_OBJECT)["extra"] == {"path": "C:\\"}
+    
+    @pytest.mark.parametrize("split", range(1, len(SCANNER_TEXT)))
+    def test_object_split_anywhere_across_two_chunks(self, split):
+        """Splitting inside a string, an escape or prose gives the same object."""
+        scanner = _JsonObjectScanner()
+        first = scanner.feed(SCANNER_TEXT[:split])
+        second = first or scanner.feed(SCANNER_TEXT[split:])
+        
+        assert second == SCANNER_OBJECT
+    
+    def test_one_character_chunks(self):
+        """Only the chunk that closes the object returns it."""
+        scanner = _JsonObjectScanner()
+        results = [scanner.feed(char) for char in SCANNER_OBJECT]
+        
+        assert results[:-1] == [None] * (len(SCANNER_OBJECT) - 1)
+        assert results[-1] == SCANNER_OBJECT
+    
+    def test_escape_at_end_of_chunk(self):
+        """A backslash ending one chunk still escapes the quote starting the next."""
+        scanner = _JsonObjectScanner()
+        
+        assert scanner.feed('{"a": "x\\') is None
+        assert scanner.feed('"}') is None
+        assert scanner.feed('"}') == '{"a": "x\\"}"}'
+    
+    def test_incomplete_stream_returns_none(self):
+        """A stream that ends before the object closes never yields it."""
+        scanner = _JsonObjectScanner()
+        
+        assert scanner.feed('{"conditions": [') is None
+        assert scanner.feed('{"field": "a"}') is None
@@ -0,0 +1,322 @@
+"""
+Tests for the rule engine.
+
+Tests cover:
+1. Compiled Matchers: Generated matchers agree with the interpreter
+2. Rule Responses: Every endpoint formats a rule the same way
+3. Batch Evaluation: /evaluate-batch results, ordering and counts
+4. Evaluation Results: Only triggered rules are listed in results
+"""
+import pytest
+from fastapi import status
+import uuid
+
+from rule_engine import RuleEngine, _OPERATORS, _compile_conditions
+
+
+def _assert_matchers_agree(conditions, event_data, logic="AND"):
+    """Check the compiled matcher against the interpreter and return the result."""
+    compiled = _compile_conditions(conditions, logic)(event_data)
+    interpreted = RuleEngine._evaluate_conditions(conditions, event_data, logic)
+    assert compiled is interpreted
+    return compiled
+
+
+def _create_rule(client, name, conditions, amount_cents, logic="AND"):
+    """Create an active rule crediting the event's referrer, returning its id."""
+    response = client.post(
+        "/api/v1/rules/",
+        json={
+            "name": name,
+            "rule_json": {
+                "conditions": conditions,
+                "actions": [{
+                    "type": "credit",
+                    "user": "referrer_id",
+                    "amount_cents": amount_cents,
+                    "reward_id": f"{name}_reward"
+                }],
+                "logic": logic
+            }
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()["id"]
+
+
+# (operator, expected value, event values) covering matches, misses and
+# mismatched types for every supported operator
+OPERATOR_CASES = [
+    ("==", 3, [3, 4, "3", None]),
+    ("!=", 3, [3, 4, "3", None]),
+    (">", 3, [2, 3, 4, 3.5]),
+    ("<", 3, [2, 3, 4, 2.5]),
+    (">=", 3, [2, 3, 4]),
+    ("<=", 3, [2, 3, 4]),
+    (">", "m", ["a", "m", "z"]),
+    ("in", ["gold", "silver"], ["gold", "bronze", None]),
+    ("not_in", ["gold", "silver"], ["gold", "bronze", None]),
+    ("contains", "vip", [["vip", "beta"], ["beta"], "super-vip", "none", {"vip": 1}]),
+]
+
+
+class TestCompiledMatcher:
+    """The compiled matcher must behave exactly like _evaluate_conditions."""
+    
+    def test_cases_cover_every_operator(self):
+        """Adding an operator without test cases should fail here."""
+        assert {case[0] for case in OPERATOR_CASES} == set(_OPERATORS)
+    
+    @pytest.mark.parametrize("operator,expected,actual_values", OPERATOR_CASES)
+    def test_operators_match_interpreter(self, operator, expected, actual_values):
+        """Each operator gives the same answer compiled and interpreted."""
+        conditions = [{"field": "user.value", "operator": operator, "value": expected}]
+        
+        outcomes = {
+            _assert_matchers_agree(conditions, {"user": {"value": actual}})
+            for actual in actual_values
+        }
+        
+        # Every operator has at least one matching and one non-matching case
+        assert outcomes == {True, False}
+    
+    @pytest.mark.parametrize("operator,expected", [(">", 3), ("in", 3), ("contains", "x")])
+    def test_type_errors_match_interpreter(self, operator, expected):
+        """Incomparable values raise the same error from both paths."""
+        conditions = [{"field": "value", "operator": operator, "value": expected}]
+        event_data = {"value": 5 if operator == "contains" else None}
+        
+        with pytest.raises(TypeError):
+            _compile_conditions(conditions)(event_data)
+        with pytest.raises(TypeError):
+            RuleEngine._evaluate_conditions(conditions, event_data)
+    
+    def test_unknown_operator_never_matches(self):
+        """An operator outside the supported set is false, not an error."""
+        conditions = [{"field": "value", "operator": "~=", "value": 1}]
+        
+        assert _assert_matchers_agree(conditions, {"value": 1}) is False
+    
+    def test_default_operator_is_equality(self):
+        """A condition without an operator compares with ==."""
+        conditions = [{"field": "value", "value": 1}]
+        
+        assert _assert_matchers_agree(conditions, {"value": 1}) is True
+        assert _assert_matchers_agree(conditions, {"value": 2}) is False
+    
+    def test_missing_leaf_reads_as_none(self):
+        """A missing final key compares as None."""
+        conditions = [{"field": "referrer.profile.tier", "operator": "==", "value": None}]
+        
+        assert _assert_matchers_agree(conditions, {"referrer": {"profile": {}}}) is True
+        assert _assert_matchers_agree(conditions, {"referrer": {"profile": {"tier": "gold"}}}) is False
+    
+    @pytest.mark.parametrize("event_data", [
+        {},
+        {"referrer": None},
+        {"referrer": {}},
+        {"referrer": {"profile": None}},
+    ])
+    def test_missing_intermediate_never_matches(self, event_data):
+        """A path that ends early doesn't match, even against None."""
+        conditions = [{"field": "referrer.profile.tier", "operator": "==", "value": None}]
+        
+        assert _assert_matchers_agree(conditions, event_data) is False
+    
+    @pytest.mark.parametrize("event_data", [
+        {"referrer": 5},
+        {"referrer": "paid"},
+        {"referrer": ["paid"]},
+        {"referrer": {"profile": 7}},
+        "not an object",
+    ])
+    def test_non_dict_path_never_matches(self, event_data):
+        """Hitting a non-dict before the end of the path is not a match."""
+        conditions = [{"field": "referrer.profile.tier", "operator": "!=", "value": "gold"}]
+        
+        assert _assert_matchers_agree(conditions, event_data) is False
+    
+    def test_empty_conditions_always_match(self):
+        """A rule without conditions matches every event, whatever the logic."""
+        for logic in ("AND", "OR", "XOR"):
+            assert _assert_matchers_agree([], {"anything": 1}, logic) is True
+    
+    @pytest.mark.parametrize("logic", ["AND", "OR", "XOR"])
+    def test_logic_matches_interpreter(self, logic):
+        """AND, OR and unknown logic (treated as AND) agree for every combination."""
+        conditions = [
+            {"field": "a", "operator": "==", "value": 1},
+            {"field": "b", "operator": "==", "value": 1},
+        ]
+        
+        for a in (0, 1):
+            for b in (0, 1):
+                matched = _assert_matchers_agree(conditions, {"a": a, "b": b}, logic)
+                assert matched is (bool(a or b) if logic == "OR" else bool(a and b))
+    
+    @pytest.mark.parametrize("logic,first_value", [("AND", 2), ("OR", 1)])
+    def test_conditions_short_circuit(self, logic, first_value):
+        """Conditions after the deciding one are not evaluated."""
+        conditions = [
+            {"field": "a", "operator": "==", "value": first_value},
+            # Would raise TypeError (None > 0) if evaluated
+            {"field": "missing", "operator": ">", "value": 0},
+        ]
+        
+        _assert_matchers_agree(conditions, {"a": 1}, logic)
+
+
+class TestRuleResponses:
+    """Test that single-rule and listing endpoints agree on formatting."""
+    
+    def test_timestamps_match_across_endpoints(self, client):
+        """Create, get and list return the same microsecond ISO timestamps."""
+        response = client.post(
+            "/api/v1/rules/",
+            json={"name": "formatting", "rule_json": {"conditions": [], "actions": []}}
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        created = response.json()
+        
+        fetched = client.get(f"/api/v1/rules/{created['id']}").json()
+        (listed,) = client.get("/api/v1/rules/").json()
+        
+        for field in ("id", "created_at", "updated_at"):
+            assert created[field] == fetched[field] == listed[field]
+        # YYYY-MM-DDTHH:MM:SS.ffffff
+        assert len(created["created_at"]) == 26
+
+
+class TestBatchEvaluation:
+    """Test POST /api/v1/rules/evaluate-batch."""
+    
+    def test_batch_evaluates_events_in_order(self, client, get_balance):
+        """Each event gets its own result, in request order, with per-event counts."""
+        _create_rule(
+            client, "paid_referrer",
+            [{"field": "referrer.is_paid_user", "operator": "==", "value": True}],
+            5000
+        )
+        _create_rule(
+            client, "three_referrals",
+            [{"field": "referral_count", "operator": ">=", "value": 3}],
+            2000
+        )
+        
+        events = [
+            {"event_id": "evt_1", "referrer_id": "batch_user_1",
+             "referrer": {"is_paid_user": True}, "referral_count": 3},
+            {"event_id": "evt_2", "referrer_id": "batch_user_2",
+             "referrer": {"is_paid_user": False}, "referral_count": 1},
+            {"event_id": "evt_3", "referrer_id": "batch_user_3",
+             "referrer": {"is_paid_user": False}, "referral_count": 5},
+        ]
+        
+        response = client.post("/api/v1/rules/evaluate-batch", json={"events": events})
+        
+        assert response.status_code == status.HTTP_200_OK
+        results = response.json()
+        assert [result["event_data"] for result in results] == events
+        assert [result["rules_evaluated"] for result in results] == [2, 2, 2]
+        assert [result["rules_triggered"] for result in results] == [2, 0, 1]
+        assert [len(result["results"]) for result in results] == [2, 0, 1]
+        assert results[2]["results"][0]["rule_name"] == "three_referrals"
+        
+        assert get_balance("batch_user_1") == 7000
+        assert get_balance("batch_user_2") == 0
+        assert get_balance("batch_user_3") == 2000
+    
+    def test_batch_with_rule_id_only_evaluates_that_rule(self, client):
+        """rule_id restricts every event in the batch to one rule."""
+        rule_id = _create_rule(client, "any_event", [], 1000)
+        _create_rule(client, "also_any_event", [], 1000)
+        
+        response = client.post(
+            "/api/v1/rules/evaluate-batch",
+            json={
+                "events": [{"event_id": "evt_a", "referrer_id": "batch_user_4"}],
+                "rule_id": rule_id
+            }
+        )
+        
+        assert response.status_code == status.HTTP_200_OK
+        (result,) = response.json()
+        assert result["rules_evaluated"] == 1
+        assert result["rules_triggered"] == 1
+        assert result["results"][0]["rule_id"] == rule_id
+    
+    def test_repeated_event_in_batch_credits_once(self, client, get_balance):
+        """The same event twice in a batch is an idempotent retry of its credit."""
+        _create_rule(client, "every_event", [], 1500)
+        event = {"event_id": f"evt_{uuid.uuid4().hex}", "referrer_id": "batch_user_5"}
+        
+        response = client.post(
+            "/api/v1/rules/evaluate-batch", json={"events": [event, event]}
+        )
+        
+        assert response.status_code == status.HTTP_200_OK
+        actions = [result["results"][0]["actions_executed"][0] for result in response.json()]
+        assert [action["is_duplicate"] for action in actions] == [False, True]
+        assert get_balance("batch_user_5") == 1500
+    
+    def test_empty_batch_rejected(self, client):
+        """A batch must contain at least one event."""
+        response = client.post("/api/v1/rules/evaluate-batch", json={"events": []})
+        
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+
+class TestEvaluationResults:
+    """Test the summary returned by POST /api/v1/rules/evaluate."""
+    
+    def test_results_list_only_triggered_rules(self, client):
+        """Rules that didn't match are counted but not listed."""
+        triggered_id = _create_rule(
+            client, "big_purchase",
+            [{"field": "purchase.amount_cents", "operator": ">", "value": 10000}],
+            2500
+        )
+        _create_rule(
+            client, "gold_tier",
+            [{"field": "user.tier", "operator": "==", "value": "gold"}],
+            2500
+        )
+        
+        response = client.post(
+            "/api/v1/rules/evaluate",
+            json={"event_data": {
+                "event_id": "evt_purchase",
+                "referrer_id": "eval_user_1",
+                "purchase": {"amount_cents": 20000},
+                "user": {"tier": "silver"}
+            }}
+        )
+        
+        assert response.status_code == status.HTTP_200_OK
+        result = response.json()
+        assert result["rules_evaluated"] == 2
+        assert result["rules_triggered"] == 1
+        (triggered,) = result["results"]
+        assert triggered["rule_id"] == triggered_id
+        assert triggered["conditions_met"] is True
+        assert triggered["actions_executed"][0]["success"] is True
+    
+    def test_no_matching_rules_returns_empty_results(self, client, get_balance):
+        """An event no rule matches still reports how many rules were checked."""
+        _create_rule(
+            client, "paid_only",
+            [{"field": "referrer.is_paid_user", "operator": "==", "value": True}],
+            5000
+        )
+        
+        response = client.post(
+            "/api/v1/rules/evaluate",
+            json={"event_data": {"referrer_id": "eval_user_2", "referrer": {"is_paid_user": False}}}
+        )
+        
+        assert response.status_code == status.HTTP_200_OK
+        result = response.json()
+        assert result["rules_evaluated"] == 1
+        assert result["rules_triggered"] == 0
+        assert result["results"] == []
+        assert get_balance("eval_user_2") == 0